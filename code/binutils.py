@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+This modules provides utility functions for working with binary matrix files.
+The functions have the same call shape as the matrix functions in csvutils but
+the matrix is stored as a typed numpy (.npy) file so it can be loaded without
+parsing text and can be memory-mapped.  The column names and data type of a
+matrix are stored in a JSON file next to the matrix file (<file_path>.json).
+"""
+
+import os
+import json
+import numpy as np
+
+# extension of the file holding the column metadata for a matrix file
+meta_ext = '.json'
+
+# ==================================================
+# Functions to write matrices to binary files
+# ==================================================
+'''
+Save the specified 2D array to a binary file.
+
+Inputs:
+
+  file_path:
+    the path the file where the feature matrix should be written (the path is
+    used as is, .npy is not appended)
+
+  features:
+    a 2D numpy array containing one line for each object and one column for
+    each feature
+
+  columns: (optional)
+    names of the attributes that are included in the feature matrix, if the
+    list is not None then the names are written to the metadata file
+
+  dtype: (optional)
+    the data type used to store the matrix, by default the data type of the
+    array is used
+'''
+def save_matrix(file_path, features, columns=None, dtype=None):
+    if (dtype is not None):
+        features = features.astype(dtype)
+    # write to a temporary file first so that readers never see a partial matrix
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as fout:
+        np.save(fout, features)
+    os.rename(tmp_path, file_path)
+
+    # write the column metadata
+    if (columns is not None):
+        save_columns(file_path, columns, features)
+
+'''
+Write the column metadata for the matrix stored in the specified file.
+'''
+def save_columns(file_path, columns, features):
+    meta = {'columns': list(columns),
+            'dtype': str(features.dtype),
+            'shape': list(features.shape)}
+    with open(file_path + meta_ext, 'w') as fout:
+        json.dump(meta, fout)
+
+# ==================================================
+# Functions to read matrices from binary files
+# ==================================================
+'''
+Load data from the specified binary file into a 2D array.
+
+Inputs:
+
+  file_path:
+    the path to the file holding the data to be loaded
+
+  mmap: (optional)
+    whether the file should be memory-mapped (read-only) instead of read into
+    memory, by default this is True
+
+Outputs:
+
+  features:
+    a 2D numpy array containing one line for each object and one
+    column for each feature
+'''
+def load_matrix(file_path, mmap=True):
+    features = np.load(file_path, mmap_mode=('r' if mmap else None))
+    # return a plain array that shares the mapped memory
+    return np.asarray(features)
+
+'''
+Load the names of the columns of the matrix stored in the specified file.
+Returns None if the column names were not saved with the matrix.
+'''
+def load_columns(file_path):
+    meta_path = file_path + meta_ext
+    if (not os.path.exists(meta_path)):
+        return None
+    with open(meta_path, 'r') as fin:
+        return json.load(fin)['columns']
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Script used to build the offline spelling correction index (see spellutils)
+from a word list.
+
+Arguments:
+  wordlist - path to the word list (one word per line, optionally followed by
+             whitespace and the frequency of the word)
+  indexdir - path to the directory where the index should be written
+"""
+
+import spellutils
+import argparse
+
+def main():
+    desc = 'Build the offline spelling correction index from a word list'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('wordlist', help='path to the word list (one word per line, optionally followed '+
+                                         'by the frequency of the word)')
+    parser.add_argument('indexdir', help='path to the directory where the index should be written')
+
+    args = parser.parse_args()
+
+    run_script(args.wordlist, args.indexdir)
+# end main
+
+def run_script(wordlist, index_dir):
+    print 'reading words from %s...' % wordlist
+    word_counts = spellutils.read_word_list(wordlist)
+
+    print 'building spelling index for %d words...' % len(word_counts)
+    index = spellutils.build_index(word_counts)
+
+    print 'writing spelling index to %s...' % index_dir
+    spellutils.save_index(index, index_dir)
+# end run_script
+
+# run main method when this file is run from command line
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a persistent on-disk cache for generated data sets.  Each
+cache entry is stored as a file in the cache directory whose name is a hash of
+everything that determines the content of the data set:
+
+  - the prediction date
+  - the options used to generate the data set (under-sampling and its seed,
+    binary classes, regression, states and the list of features)
+  - fingerprints of the business, review, tip and sentiment input files (or
+    of the business file and the partition manifest when the events are loaded
+    from partitions, see partutils)
+
+The total size of the cache is bounded, when it is exceeded the least recently
+used entries are removed.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import binutils
+import partutils
+
+# version of the cache entry format, changing it invalidates all entries
+# - version 2: matrix columns are in FeatureSchema (sorted) order
+# - version 3: examples and labels are stored as one memory-mapped .npy matrix
+cache_version = 3
+
+# number of bytes read from the start and end of a file for its fingerprint
+fingerprint_bytes = 1024*1024
+
+# default maximum size of the cache (in bytes)
+default_max_bytes = 1024*1024*1024
+
+'''
+Cache of generated data sets stored in a directory.
+
+Inputs:
+
+  cache_dir:
+    the directory where the cache entries are stored, it is created if it
+    doesn't exist
+
+  input_files:
+    list of the paths to the input files used to generate the data sets, the
+    fingerprints of these files are part of every cache key
+
+  max_bytes: (optional)
+    the maximum total size of the cache entries, the least recently used
+    entries are removed when this size is exceeded (default is 1 GB)
+'''
+class DatasetCache(object):
+    def __init__(self, cache_dir, input_files, max_bytes=default_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if (not os.path.isdir(cache_dir)):
+            os.makedirs(cache_dir)
+        # fingerprint the input files once
+        self.inputs = [file_fingerprint(f) for f in input_files]
+
+    '''
+    Return the cache key for the data set generated for the prediction date
+    using the specified options.  Returns None if the data set can't be cached
+    because it is not reproducible (under-sampling without a seed).
+    '''
+    def key(self, pdate, usamp=True, seed=None, binary=None, reg=False, states=None,
+            feat_info=None, kind='xy', usamp_exact=False):
+        if (usamp and seed is None):
+            return None
+        desc = {'version': cache_version,
+                'kind': kind,
+                'pdate': pdate,
+                'usamp': bool(usamp),
+                'seed': seed,
+                'usamp_exact': bool(usamp and usamp_exact),
+                'binary': sorted(binary) if binary else None,
+                'reg': bool(reg),
+                'states': sorted(states) if states else None,
+                'feats': feat_desc(feat_info),
+                'inputs': self.inputs}
+        return hashlib.sha1(json.dumps(desc, sort_keys=True)).hexdigest()
+
+    '''
+    Return the path of the cache entry for the key and file extension.
+    '''
+    def entry_path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    '''
+    Load the examples (X) and labels (y) stored for the key.  Returns None if
+    there is no entry for the key.  The entry is memory-mapped, X and y are
+    read-only views of the mapped matrix.
+    '''
+    def load_xy(self, key):
+        if (key is None):
+            return None
+        path = self.entry_path(key, '.npy')
+        if (not os.path.exists(path)):
+            return None
+        self.touch(path)
+        data = binutils.load_matrix(path, mmap=True)
+        return data[:,:-1], data[:,-1]
+
+    '''
+    Store the examples (X) and labels (y) for the key.  They are stored as one
+    matrix with the labels in the last column.
+    '''
+    def save_xy(self, key, X, y):
+        if (key is None):
+            return
+        path = self.entry_path(key, '.npy')
+        binutils.save_matrix(path, np.column_stack([X, y]))
+        self.evict()
+
+    '''
+    Copy the file stored for the key and file extension to the output path.
+    Returns False if there is no entry for the key.
+    '''
+    def copy_out(self, key, ext, out_path):
+        if (key is None):
+            return False
+        path = self.entry_path(key, ext)
+        if (not os.path.exists(path)):
+            return False
+        self.touch(path)
+        shutil.copyfile(path, out_path)
+        return True
+
+    '''
+    Store a copy of the file at the input path for the key and file extension.
+    '''
+    def copy_in(self, key, ext, in_path):
+        if (key is None):
+            return
+        path = self.entry_path(key, ext)
+        tmp_path = path + '.tmp'
+        shutil.copyfile(in_path, tmp_path)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    '''
+    Mark the cache entry as recently used.
+    '''
+    def touch(self, path):
+        os.utime(path, None)
+
+    '''
+    Remove the least recently used entries until the total size of the cache
+    entries doesn't exceed the maximum size.
+    '''
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if (name.endswith('.tmp')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        # remove the oldest entries first
+        entries.sort()
+        for mtime, size, path in entries:
+            if (total <= self.max_bytes):
+                break
+            os.remove(path)
+            total -= size
+# end DatasetCache
+
+'''
+Return a fingerprint for the file at the specified path.  The fingerprint
+includes the size and modification time of the file and a hash of the first
+and last megabyte of its content, so large files don't have to be read in full.
+'''
+def file_fingerprint(file_path):
+    st = os.stat(file_path)
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as fin:
+        h.update(fin.read(fingerprint_bytes))
+        if (st.st_size > fingerprint_bytes):
+            fin.seek(max(fingerprint_bytes, st.st_size - fingerprint_bytes))
+            h.update(fin.read(fingerprint_bytes))
+    return [os.path.basename(file_path), st.st_size, int(st.st_mtime), h.hexdigest()]
+
+'''
+Return the list of the input files whose fingerprints should be part of the
+cache keys.  When the events are loaded from the partitions in part_dir the
+review, tip and sentiment files are not read, so the manifest of the partitions
+(which is rewritten whenever the partitions are) is used in their place.
+'''
+def input_files(busjson, revjson, tipjson, senticsv, part_dir=None):
+    if (part_dir):
+        return [busjson, os.path.join(part_dir, partutils.manifest_file)]
+    return [busjson, revjson, tipjson, senticsv]
+
+'''
+Return a description of the features (name, data type and default value of
+each feature) that can be included in a cache key.
+'''
+def feat_desc(feat_info):
+    if (feat_info is None):
+        return None
+    return sorted([key, str(info[0]), str(info[1])] for key,info in feat_info.iteritems())
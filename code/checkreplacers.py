@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Script used to check that replacers.ContractionReplacer makes exactly the same
+replacements as replacers.RegexpReplacer and, optionally, to compare their
+speed.  A set of synthetic texts with unusual combinations of contractions
+(including the repeated suffixes handled by the fallback and unicode texts) is
+always checked, the texts of a sample of review or tip objects (lowercased, as
+they are in preprocessing) are checked as well if a JSON file is specified.
+Any text with a different result is printed and the script exits with a
+nonzero status if there are any.
+
+Arguments:
+  injson   - (optional) path to the file holding the JSON review or tip
+             objects
+  -n       - (optional) the number of objects in the sample (default is 10000)
+  -textkey - (optional) the name of the attribute holding the text (default
+             is text)
+  -bench   - (optional) also print the time taken by each replacer for the
+             texts of the sample
+"""
+
+import sys
+import json
+import time
+import itertools
+import replacers
+import argparse
+
+# texts with unusual combinations of contractions and word characters
+synthetic_texts = ["won't can't i'm ain't they'll don't we've you're he'd",
+                   "xwon't scan't hi'm wain't won'tn't can't've i'm'd",
+                   "a'll'll don'tn't we've've you're're he'd'd x'd've",
+                   "'ll n't 've 're 'd '' ' 'n't won' t it's ol' rock'n'roll",
+                   u"caf\xe9's won't \xe9'll na\xefve'd",
+                   u"caf\xe9'll'll na\xefve'd'd won't",
+                   u"no contractions \xe0 la carte",
+                   "no contractions, just punctuation!? (really) #1 ~ok~",
+                   ""]
+
+def main():
+    desc = 'Check (and optionally benchmark) the contraction replacers'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('injson', nargs='?', help='path to the file holding the JSON review or tip objects')
+    parser.add_argument('-n', type=int, default=10000,
+                        help='the number of objects in the sample (default is 10000)')
+    parser.add_argument('-textkey', default='text',
+                        help='the name of the attribute holding the text (default is text)')
+    parser.add_argument('-bench', help='print the time taken by each replacer for the sample texts',
+                        action='store_true')
+
+    args = parser.parse_args()
+
+    mismatches = run_script(args.injson, args.n, text_key=args.textkey, bench=args.bench)
+    sys.exit(1 if (mismatches > 0) else 0)
+# end main
+
+def run_script(injson=None, n=10000, text_key='text', bench=False):
+    texts = []
+    if (injson):
+        print 'loading %d texts from %s...' % (n, injson)
+        with open(injson, 'r') as fin:
+            texts = [json.loads(line).get(text_key, u'').lower() for line in itertools.islice(fin, n)]
+
+    mismatches = check_replacers(synthetic_texts + texts)
+    if (bench and texts):
+        benchmark_replacers(texts)
+    return mismatches
+# end run_script
+
+'''
+Check that ContractionReplacer returns the same text (of the same type) as
+RegexpReplacer for each of the texts, the mismatches are printed.  Returns the
+number of mismatches.
+'''
+def check_replacers(texts):
+    regexp_replacer = replacers.RegexpReplacer()
+    contraction_replacer = replacers.ContractionReplacer()
+
+    mismatches = 0
+    for text in texts:
+        expected = regexp_replacer.replace(text)
+        actual = contraction_replacer.replace(text)
+        if (actual != expected or type(actual) != type(expected)):
+            mismatches += 1
+            print 'MISMATCH: %r\n  expected: %r\n  actual:   %r' % (text, expected, actual)
+    print '%d mismatches in %d texts' % (mismatches, len(texts))
+    return mismatches
+
+'''
+Print the time taken by each replacer to expand the texts.
+'''
+def benchmark_replacers(texts):
+    regexp_replacer = replacers.RegexpReplacer()
+    contraction_replacer = replacers.ContractionReplacer()
+
+    start = time.time()
+    for text in texts:
+        regexp_replacer.replace(text)
+    regexp_secs = time.time() - start
+
+    start = time.time()
+    contraction_replacer.replace_batch(texts)
+    contraction_secs = time.time() - start
+
+    print 'RegexpReplacer:      %.3f secs (%.1f texts/sec)' % (regexp_secs, len(texts)/max(regexp_secs, 1e-6))
+    print 'ContractionReplacer: %.3f secs (%.1f texts/sec)' % (contraction_secs, len(texts)/max(contraction_secs, 1e-6))
+    if (contraction_secs > 0):
+        print 'speedup: %.1fx' % (regexp_secs/contraction_secs)
+
+# run main method when this file is run from command line
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ Arguments:
   in_tipjson   - path to the file holding unfiltered yelp tip data
   out_tipjson  - path to the file where filtered tip data should be written
   in_censuscsv - path to the file holding census tract mappings for businesses
+  jobs         - (optional) number of processes used to parse the review and
+                 tip files, -1 uses one process per CPU (default is 1)
+  -refresh     - (optional) refresh previously created files incrementally,
+                 only the new reviews and tips are processed (see
+                 datautils.refresh_yelp_data)
 
 Created on Mon Nov 03 00:06:14 2014
 
@@ -21,34 +26,43 @@ import datautils
 import sys
 
 def main():
-    if (len(sys.argv) < 8):
-        usage(sys.argv)
+    # the refresh flag can be placed anywhere on the command line
+    refresh = ('-refresh' in sys.argv)
+    argv = [arg for arg in sys.argv if arg != '-refresh']
+    if (len(argv) < 8):
+        usage(argv)
         return
 
-    in_busjson   = sys.argv[1]
-    out_busjson  = sys.argv[2]
-    in_revjson   = sys.argv[3]
-    out_revjson  = sys.argv[4]
-    in_tipjson   = sys.argv[5]
-    out_tipjson  = sys.argv[6]
-    in_censuscsv = sys.argv[7]
+    in_busjson   = argv[1]
+    out_busjson  = argv[2]
+    in_revjson   = argv[3]
+    out_revjson  = argv[4]
+    in_tipjson   = argv[5]
+    out_tipjson  = argv[6]
+    in_censuscsv = argv[7]
+    jobs = int(argv[8]) if (len(argv) > 8) else 1
 
     run_script(in_busjson, out_busjson, in_revjson, out_revjson,
-               in_tipjson, out_tipjson, in_censuscsv)
+               in_tipjson, out_tipjson, in_censuscsv, jobs, refresh)
 # end main
 
 def run_script(in_busjson, out_busjson, in_revjson, out_revjson,
-               in_tipjson, out_tipjson, in_censuscsv):
+               in_tipjson, out_tipjson, in_censuscsv, jobs=1, refresh=False):
     #print('initializing feature lists')
     #feat_info.init_data_feats(datafeats)
     
-    print('creating filtered JSON files...')
-    datautils.filter_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
-                               in_tipjson, out_tipjson, in_censuscsv)
+    if (refresh):
+        print('refreshing filtered JSON files...')
+        datautils.refresh_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
+                                    in_tipjson, out_tipjson, in_censuscsv, jobs)
+    else:
+        print('creating filtered JSON files...')
+        datautils.filter_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
+                                   in_tipjson, out_tipjson, in_censuscsv, jobs)
 # end run_script
 
 def usage(argv):
-    print 'Usage: %s <in_busjson> <out_busjson> <in_revjson> <out_revjson> <in_tipjson> <out_tipjson> <in_censuscsv>' % argv[0]
+    print 'Usage: %s <in_busjson> <out_busjson> <in_revjson> <out_revjson> <in_tipjson> <out_tipjson> <in_censuscsv> [jobs] [-refresh]' % argv[0]
 # end usage
 
 # run main method when this file is run from command line
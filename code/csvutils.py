@@ -92,7 +92,8 @@ Inputs:
     the path the file containing JSON objects
 
   objects:
-    list of JSON objects, the JSON objects are python dictionaries
+    list (or any other iterable, e.g. a generator) of JSON objects, the JSON
+    objects are python dictionaries
 
   columns:
     list of keys for attributes to be written to the file, only the columns
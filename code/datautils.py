@@ -8,10 +8,15 @@ Created on Wed Oct 29 18:31:04 2014
 @author John Maloney
 """
 
-import json
 import feat_info as fi
-import time
+import os
+import io
+import json
+import hashlib
 import math
+import collections
+import dateutils
+import idutils
 import jsonutils
 import csvutils
 import numpy as np
@@ -23,6 +28,25 @@ year = 12*month
 sec_per_day = 60*60*24
 latest_date_str = '2014-07-30'
 
+# extension added to the name of the filtered business file to get the name of
+# the file holding the state used to refresh the filtered data files
+# incrementally
+filter_state_ext = '.state'
+
+# number of bytes before the recorded offset of an input file that are hashed
+# to check whether the input file was only appended to
+tail_bytes = 64*1024
+
+# attributes added to business objects from review, tip and sentiment events,
+# each count attribute is listed with the attributes that are added to a
+# business object when the count for the business is non-zero
+event_attr_groups = [(fi.review_count, [fi.review_count, fi.star_total]),
+                     (fi.tip_count, [fi.tip_count]),
+                     (fi.senti_count, [fi.senti_count, fi.senti_total])]
+for qtr in xrange(4):
+    event_attr_groups.append((fi.qtr_review_count[qtr], [fi.qtr_review_count[qtr], fi.qtr_star_total[qtr]]))
+    event_attr_groups.append((fi.qtr_tip_count[qtr], [fi.qtr_tip_count[qtr]]))
+
 '''
 Generate data sets that contain values that were available on the specified
 prediction dates.  Each generated dataset will be written to the file:
@@ -98,7 +122,8 @@ Inputs:
     all the JSON tip objects to consider for the dataset
 
   all_senti:
-    matrix containing all sentiment ranks to consider for the dataset
+    matrix containing all sentiment ranks to consider for the dataset, or the
+    typed sentiment columns returned by eventutils.load_senti
 
   verbose: (optional)
     flag indicating whether verbose output should be produced (default is True)
@@ -118,10 +143,35 @@ Inputs:
     the proportion of samples in this class is similar to the proportion of
     samples in the other classes (default is True)
 
+  seed: (optional)
+    seed for the random number generator used for undersampling, combined with
+    the prediction date so that the same seed selects different businesses for
+    different prediction dates, if None then the generator is not seeded and
+    the data set is not reproducible (default is None)
+
+  usamp_exact: (optional)
+    if True then exactly the target number of "still open" businesses is
+    selected when undersampling, otherwise each "still open" business is kept
+    with probability equal to the undersampling weight (default is False)
+
   states: (optional)
     list of the states to include in the data set, if the parameter is None
     then all states are included (default is None)
 
+  events: (optional)
+    an eventutils.EventStore holding the review, tip and sentiment events, if
+    specified then all_reviews, all_tips and all_senti are ignored and can be
+    None (default is None)
+
+  engine: (optional)
+    the method used to add the events in the event store to the business
+    objects, 'numpy' aggregates the events for all businesses at once using
+    numpy, 'index' uses the sorted (business, date) index of the event store
+    (best when generating data sets for many prediction dates), 'incremental'
+    advances running totals kept by the event store from the previous
+    prediction date (best when walking forward in time) and 'loop' processes
+    the events one at a time, all produce the same data set (default is 'numpy')
+
 Outputs:
 
   buses:
@@ -129,7 +179,8 @@ Outputs:
     and tip data (and eventually with census and economic data), a copy is made
     of the original JSON objects so that the objects in all_buses are not modified
 '''
-def gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, verbose=True, usamp=True, binary=None, reg=False, states=None):
+def gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, verbose=True, usamp=True, binary=None, reg=False, states=None,
+                events=None, engine='numpy', seed=None, usamp_exact=False):
     pdate_plus_3mos  =  pdate+3*month # end of following year 1st quarter
     pdate_plus_6mos  =  pdate+6*month # end of following year 2nd quarter
     pdate_plus_9mos  =  pdate+9*month # end of following year 3rd quarter
@@ -204,124 +255,40 @@ def gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, verbose=True
             print '    class %1d: %5d' % (i,class_counts[i])
     # end verbose
 
-    qtr_boundary = [0,0,0,0,0]
-    qtr_boundary[0] = pdate-12*month # start of prior year 1th quarter
-    qtr_boundary[1] = pdate -9*month # start of prior year 2nd quarter
-    qtr_boundary[2] = pdate -6*month # start of prior year 3rd quarter
-    qtr_boundary[3] = pdate -3*month # start of prior year 4th quarter
-    qtr_boundary[4] = pdate          # end of prior year 4st quarter
-
-    # filter reviews that do not pertain to one of the remaining businesses or
-    # were not submitted before pdate
-    all_rev_count = 0
-    qtr_rev_counts = [0, 0, 0, 0]
-    for review in all_reviews:
-        # look for the reviewed business
-        bid = review[fi.business_id]
-        obj = buses.get(bid, None)
-
-        # update review_count, star_count and star_total for the business
-        if (obj is not None):
-            rdate = review[fi.date]
-            if (rdate <= pdate):
-                all_rev_count = all_rev_count + 1
-
-                # update overall review count
-                rcount = obj.get(fi.review_count,0)
-                obj[fi.review_count] = rcount + 1
-                # update overall star total
-                stars = review.get(fi.stars,0)
-                stotal = obj.get(fi.star_total,0)
-                obj[fi.star_total] = stotal + stars
-
-                # update the quarterly review counts and star totals
-                for qtr in xrange(4):
-                    if ((rdate > qtr_boundary[qtr]) and (rdate <= qtr_boundary[qtr+1])):
-                        # review submitted during this quarter
-                        qtr_rev_counts[qtr] = qtr_rev_counts[qtr] + 1
-                        # update review count for this quarter
-                        qtr_rcount = obj.get(fi.qtr_review_count[qtr],0)
-                        obj[fi.qtr_review_count[qtr]] = qtr_rcount + 1
-                        # update star total for this quarter
-                        qtr_stotal = obj.get(fi.qtr_star_total[qtr],0)
-                        obj[fi.qtr_star_total[qtr]] = qtr_stotal + stars
-                        # don't need to check the other quarters for this review
-                        break
-    # end for
-
-    if (verbose):
-        print '  number of reviews that passed filter: %d' % all_rev_count
-        for i in xrange(4):
-            print '    review count q%1d: %5d' % (i+1,qtr_rev_counts[i])
-    # end verbose
-
-    # filter tips that do not pertain to one of the remaining businesses or
-    # were not submitted before pdate
-    all_tip_count = 0
-    qtr_tip_counts = [0, 0, 0, 0]
-    for tip in all_tips:
-        # look for the reviewed business
-        bid = tip[fi.business_id]
-        obj = buses.get(bid, None)
-
-        # update tip_count for the business
-        if (obj is not None):
-            tdate = tip[fi.date]
-            if (tdate <= pdate):
-                all_tip_count = all_tip_count + 1
-
-                # update overall tip count
-                tcount = obj.get(fi.tip_count,0)
-                obj[fi.tip_count] = tcount + 1
-
-                # update quarterly tip counts
-                for qtr in xrange(4):
-                    if ((tdate > qtr_boundary[qtr]) and (tdate <= qtr_boundary[qtr+1])):
-                        # tip submitted during this quarter
-                        qtr_tip_counts[qtr] = qtr_tip_counts[qtr] + 1
-                        # update review count for this quarter
-                        qtr_tcount = obj.get(fi.qtr_tip_count[qtr],0)
-                        obj[fi.qtr_tip_count[qtr]] = qtr_tcount + 1
-                        # don't need to check the other quarters for this tip
-                        break
-    # end for
-
-    if (verbose):
-        print '  number of tips that passed filter: %d' % all_tip_count
-        for i in xrange(4):
-            print '    tip count q%1d: %5d' % (i+1,qtr_tip_counts[i])
-    # end verbose
-
-    # filter sentiment rankings that do not pertain to one of the remaining
-    # businesses or were not derived from reviews and tips submitted before pdate
-    all_senti_count = 0
-    for i in xrange(all_senti.shape[0]):
-        # look for the corresponding business
-        bid = all_senti[i,fi.senti_bus_idx]
-        obj = buses.get(bid, None)
-
-        # update senti_count and senti_total for the business
-        if (obj is not None):
-            sdate = all_senti[i,fi.senti_date_idx]
-            # convert date string to integer
-            sdate = date2int(str2date(sdate))
-            # make sure that the sentiment is for a review or tip submitted
-            # in the last six months
-            if ((sdate > qtr_boundary[2]) and (sdate <= pdate)):
-                all_senti_count += 1
-
-                # update overall senti count
-                scount = obj.get(fi.senti_count,0)
-                obj[fi.senti_count] = scount + 1
-                # update senti rank total
-                senti = int(all_senti[i,fi.senti_rank_idx])
-                stotal = obj.get(fi.senti_total,0)
-                obj[fi.senti_total] = stotal + senti
-    # end for
-
-    if (verbose):
-        print '  number of sentiment ranks that passed filter: %d' % all_senti_count
-    # end verbose
+    qtr_boundary = get_qtr_boundary(pdate)
+
+    # add the review, tip and sentiment data to the business objects
+    if (events is not None):
+        # events from the event store are keyed by business index
+        bus_lookup = events.lookup(buses)
+        if (engine == 'loop'):
+            add_review_data(bus_lookup, events.iter_reviews(), pdate, qtr_boundary, verbose)
+            add_tip_data(bus_lookup, events.iter_tips(), pdate, qtr_boundary, verbose)
+            add_senti_data(bus_lookup, events.iter_senti(), pdate, qtr_boundary, verbose, parse=False)
+        elif (engine == 'incremental'):
+            # advance the running totals to the prediction date
+            add_event_aggregates(bus_lookup, events.get_incremental().aggregate(pdate), verbose)
+        elif (engine == 'index'):
+            # use the (business, date) index to aggregate the events
+            add_event_aggregates(bus_lookup, events.get_index().aggregate(pdate), verbose)
+        else:
+            # aggregate the events for all businesses at once using numpy
+            add_event_aggregates(bus_lookup, events.aggregate(pdate), verbose)
+    else:
+        # JSON objects and sentiment matrix rows are keyed by business ID
+        review_rows = ((r[fi.business_id], r[fi.date], r.get(fi.stars,0)) for r in all_reviews)
+        tip_rows = ((t[fi.business_id], t[fi.date], None) for t in all_tips)
+        add_review_data(buses, review_rows, pdate, qtr_boundary, verbose)
+        add_tip_data(buses, tip_rows, pdate, qtr_boundary, verbose)
+        if (isinstance(all_senti, dict)):
+            # typed sentiment columns, the dates and ranks are already integers
+            senti_rows = zip(all_senti[fi.business_id].tolist(), all_senti[fi.date].tolist(),
+                             all_senti[fi.senti_rank].tolist())
+            add_senti_data(buses, senti_rows, pdate, qtr_boundary, verbose, parse=False)
+        else:
+            senti_rows = ((all_senti[i,fi.senti_bus_idx], all_senti[i,fi.senti_date_idx],
+                           all_senti[i,fi.senti_rank_idx]) for i in xrange(all_senti.shape[0]))
+            add_senti_data(buses, senti_rows, pdate, qtr_boundary, verbose)
 
     # if undersampling determine weight to use for under sampling the "still open" class
     if (usamp):
@@ -339,29 +306,22 @@ def gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, verbose=True
             # get size of largest "closed" class
             target_size = np.max(class_counts[fi.closed_q1:fi.closed_q4])
         # calculate the percentage of "still open" records that should be kept
-        weight = float(target_size)/float(class_counts[fi.still_open])
+        weight = float(target_size)/float(max(class_counts[fi.still_open],1))
         if (verbose):
             print '  weight for undersampling: %5.3f' % weight
-        # reset class count for "still open" class
-        class_counts[fi.still_open] = 0
+        # remove the "still open" records that were not selected - the records
+        # are sorted by business ID so the selection doesn't depend on the
+        # order of the dictionary
+        still_open = sorted(bid for bid,bus in buses.iteritems() if bus[fi.label] == fi.still_open)
+        keep = usamp_select(len(still_open), weight, target_size, pdate, seed, usamp_exact)
+        for i in np.flatnonzero(~keep):
+            del buses[still_open[i]]
+        class_counts[fi.still_open] = int(np.sum(keep))
 
     # calculate average star ratings, percent changes and remove unneeded attributes
     if (binary):
         bin_class_counts = [0, 0]
     for bus in buses.values():
-        # if undersampling determine whether this record should be kept
-        if (usamp):
-            label = bus[fi.label]
-            if (label == fi.still_open):
-                p = np.random.uniform(0.0, 1.0)
-                if (p > weight):
-                    # do not include this record in the data set
-                    del buses[bus[fi.business_id]]
-                    # go to the next business
-                    continue
-                else:
-                    class_counts[fi.still_open] += 1
-
         # adjust class labels if this is a binary classification problem
         if (binary):
             if (bus[fi.label] in binary):
@@ -459,6 +419,296 @@ def gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, verbose=True
     return buses.values()
 
 # end gen_dataset
+
+'''
+Select the records to keep when undersampling.
+
+Inputs:
+
+  n:
+    the number of records in the class being undersampled
+
+  weight:
+    the probability with which each record is kept
+
+  target_size:
+    the number of records to keep when exact is True
+
+  pdate:
+    the prediction date, combined with the seed
+
+  seed:
+    the seed for the random number generator, if None then the generator is
+    not seeded, the seed and the prediction date are masked to the unsigned
+    32-bit range accepted by numpy (so any integer can be used)
+
+  exact:
+    if True then exactly target_size records are kept (or all of them if there
+    are fewer than target_size records), otherwise each record is kept with
+    probability weight
+
+Outputs:
+
+  keep:
+    boolean array indicating the records that should be kept
+'''
+def usamp_select(n, weight, target_size, pdate, seed=None, exact=False):
+    if (seed is None):
+        rand = np.random.RandomState()
+    else:
+        rand = np.random.RandomState([seed & 0xffffffff, pdate & 0xffffffff])
+    if (exact):
+        # choose exactly the target number of records
+        keep = np.zeros(n, dtype=bool)
+        keep[rand.permutation(n)[:max(0, min(target_size, n))]] = True
+    else:
+        # keep each record with probability weight
+        keep = rand.uniform(0.0, 1.0, n) <= weight
+    return keep
+
+'''
+Return the boundaries of the quarters in the year prior to the prediction date.
+Quarter q covers the dates d such that qtr_boundary[q] < d <= qtr_boundary[q+1].
+'''
+def get_qtr_boundary(pdate):
+    qtr_boundary = [0,0,0,0,0]
+    qtr_boundary[0] = pdate-12*month # start of prior year 1th quarter
+    qtr_boundary[1] = pdate -9*month # start of prior year 2nd quarter
+    qtr_boundary[2] = pdate -6*month # start of prior year 3rd quarter
+    qtr_boundary[3] = pdate -3*month # start of prior year 4th quarter
+    qtr_boundary[4] = pdate          # end of prior year 4st quarter
+    return qtr_boundary
+
+'''
+Add the review count, star total and quarterly review counts and star totals
+to the business objects.
+
+Inputs:
+
+  bus_lookup:
+    dictionary mapping business keys (business IDs or business indices) to the
+    business objects selected for the data set
+
+  review_rows:
+    iterable of (business key, date, stars) tuples
+
+  pdate:
+    the prediction date (an int expressed as seconds since the epoch)
+
+  qtr_boundary:
+    the quarter boundaries for the year prior to the prediction date
+
+  verbose:
+    flag indicating whether verbose output should be produced
+'''
+def add_review_data(bus_lookup, review_rows, pdate, qtr_boundary, verbose):
+    # filter reviews that do not pertain to one of the remaining businesses or
+    # were not submitted before pdate
+    all_rev_count = 0
+    qtr_rev_counts = [0, 0, 0, 0]
+    for bid, rdate, stars in review_rows:
+        # look for the reviewed business
+        obj = bus_lookup.get(bid, None)
+
+        # update review_count, star_count and star_total for the business
+        if (obj is not None):
+            if (rdate <= pdate):
+                all_rev_count = all_rev_count + 1
+
+                # update overall review count
+                rcount = obj.get(fi.review_count,0)
+                obj[fi.review_count] = rcount + 1
+                # update overall star total
+                stotal = obj.get(fi.star_total,0)
+                obj[fi.star_total] = stotal + stars
+
+                # update the quarterly review counts and star totals
+                for qtr in xrange(4):
+                    if ((rdate > qtr_boundary[qtr]) and (rdate <= qtr_boundary[qtr+1])):
+                        # review submitted during this quarter
+                        qtr_rev_counts[qtr] = qtr_rev_counts[qtr] + 1
+                        # update review count for this quarter
+                        qtr_rcount = obj.get(fi.qtr_review_count[qtr],0)
+                        obj[fi.qtr_review_count[qtr]] = qtr_rcount + 1
+                        # update star total for this quarter
+                        qtr_stotal = obj.get(fi.qtr_star_total[qtr],0)
+                        obj[fi.qtr_star_total[qtr]] = qtr_stotal + stars
+                        # don't need to check the other quarters for this review
+                        break
+    # end for
+
+    if (verbose):
+        print '  number of reviews that passed filter: %d' % all_rev_count
+        for i in xrange(4):
+            print '    review count q%1d: %5d' % (i+1,qtr_rev_counts[i])
+    # end verbose
+# end add_review_data
+
+'''
+Add the tip count and quarterly tip counts to the business objects.
+
+Inputs:
+
+  bus_lookup:
+    dictionary mapping business keys (business IDs or business indices) to the
+    business objects selected for the data set
+
+  tip_rows:
+    iterable of (business key, date, likes) tuples
+
+  pdate:
+    the prediction date (an int expressed as seconds since the epoch)
+
+  qtr_boundary:
+    the quarter boundaries for the year prior to the prediction date
+
+  verbose:
+    flag indicating whether verbose output should be produced
+'''
+def add_tip_data(bus_lookup, tip_rows, pdate, qtr_boundary, verbose):
+    # filter tips that do not pertain to one of the remaining businesses or
+    # were not submitted before pdate
+    all_tip_count = 0
+    qtr_tip_counts = [0, 0, 0, 0]
+    for bid, tdate, likes in tip_rows:
+        # look for the reviewed business
+        obj = bus_lookup.get(bid, None)
+
+        # update tip_count for the business
+        if (obj is not None):
+            if (tdate <= pdate):
+                all_tip_count = all_tip_count + 1
+
+                # update overall tip count
+                tcount = obj.get(fi.tip_count,0)
+                obj[fi.tip_count] = tcount + 1
+
+                # update quarterly tip counts
+                for qtr in xrange(4):
+                    if ((tdate > qtr_boundary[qtr]) and (tdate <= qtr_boundary[qtr+1])):
+                        # tip submitted during this quarter
+                        qtr_tip_counts[qtr] = qtr_tip_counts[qtr] + 1
+                        # update review count for this quarter
+                        qtr_tcount = obj.get(fi.qtr_tip_count[qtr],0)
+                        obj[fi.qtr_tip_count[qtr]] = qtr_tcount + 1
+                        # don't need to check the other quarters for this tip
+                        break
+    # end for
+
+    if (verbose):
+        print '  number of tips that passed filter: %d' % all_tip_count
+        for i in xrange(4):
+            print '    tip count q%1d: %5d' % (i+1,qtr_tip_counts[i])
+    # end verbose
+# end add_tip_data
+
+'''
+Add the sentiment count and sentiment total for the six months prior to the
+prediction date to the business objects.
+
+Inputs:
+
+  bus_lookup:
+    dictionary mapping business keys (business IDs or business indices) to the
+    business objects selected for the data set
+
+  senti_rows:
+    iterable of (business key, date, rank) tuples
+
+  pdate:
+    the prediction date (an int expressed as seconds since the epoch)
+
+  qtr_boundary:
+    the quarter boundaries for the year prior to the prediction date
+
+  verbose:
+    flag indicating whether verbose output should be produced
+
+  parse: (optional)
+    if True then the dates and ranks are strings read from the sentiment
+    matrix and are converted to integers (default is True)
+'''
+def add_senti_data(bus_lookup, senti_rows, pdate, qtr_boundary, verbose, parse=True):
+    # filter sentiment rankings that do not pertain to one of the remaining
+    # businesses or were not derived from reviews and tips submitted before pdate
+    all_senti_count = 0
+    for bid, sdate, senti in senti_rows:
+        # look for the corresponding business
+        obj = bus_lookup.get(bid, None)
+
+        # update senti_count and senti_total for the business
+        if (obj is not None):
+            if (parse):
+                # convert date string and rank string from the matrix to integers
+                sdate = date2int(str2date(sdate))
+                senti = int(senti)
+            # make sure that the sentiment is for a review or tip submitted
+            # in the last six months
+            if ((sdate > qtr_boundary[2]) and (sdate <= pdate)):
+                all_senti_count += 1
+
+                # update overall senti count
+                scount = obj.get(fi.senti_count,0)
+                obj[fi.senti_count] = scount + 1
+                # update senti rank total
+                stotal = obj.get(fi.senti_total,0)
+                obj[fi.senti_total] = stotal + senti
+    # end for
+
+    if (verbose):
+        print '  number of sentiment ranks that passed filter: %d' % all_senti_count
+    # end verbose
+# end add_senti_data
+
+'''
+Add event aggregates computed by an eventutils.EventStore to the business
+objects.  An attribute is only added to a business object when the business
+has at least one event contributing to it, so the business objects are the
+same as those produced by add_review_data, add_tip_data and add_senti_data.
+
+Inputs:
+
+  bus_lookup:
+    dictionary mapping business indices to the business objects selected for
+    the data set
+
+  aggs:
+    dictionary mapping attribute names to numpy arrays holding the value of
+    the attribute for each business index
+
+  verbose:
+    flag indicating whether verbose output should be produced
+'''
+def add_event_aggregates(bus_lookup, aggs, verbose):
+    # the business indices of the selected businesses
+    idx = np.array(sorted(bus_lookup.keys()), dtype=int)
+
+    # convert the aggregates for the selected businesses to python values
+    values = {}
+    for key,vals in aggs.iteritems():
+        values[key] = vals[idx].tolist()
+
+    # add the attributes to each business object if the corresponding count
+    # is non-zero
+    for count_key,keys in event_attr_groups:
+        counts = values[count_key]
+        for j in xrange(len(idx)):
+            if (counts[j] > 0):
+                obj = bus_lookup[idx[j]]
+                for key in keys:
+                    obj[key] = values[key][j]
+
+    if (verbose):
+        print '  number of reviews that passed filter: %d' % sum(values[fi.review_count])
+        for i in xrange(4):
+            print '    review count q%1d: %5d' % (i+1,sum(values[fi.qtr_review_count[i]]))
+        print '  number of tips that passed filter: %d' % sum(values[fi.tip_count])
+        for i in xrange(4):
+            print '    tip count q%1d: %5d' % (i+1,sum(values[fi.qtr_tip_count[i]]))
+        print '  number of sentiment ranks that passed filter: %d' % sum(values[fi.senti_count])
+    # end verbose
+# end add_event_aggregates
+
 '''
 Filter the data from the Yelp! academic dataset so that it contains only objects
 and attributes that are of interest.
@@ -486,27 +736,42 @@ Inputs:
   in_demoeconcsv
     the path to the CSV file containing demographic and economic data for businesses
 
+  jobs: (optional)
+    the number of processes used to parse the review and tip files, -1 uses one
+    process per CPU (default is 1)
+
 '''
 def filter_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
-                     in_tipjson, out_tipjson, in_demoeconcsv):
+                     in_tipjson, out_tipjson, in_demoeconcsv, jobs=1):
     # initialize the column names
     #feat_columns = feat_info.data_feat_names
     bus_feats = fi.bus_feat_names
-    rev_feats = fi.rev_feat_names
-    tip_feats = fi.tip_feat_names
     
     # make sure the data features have been initialized
     #if (len(feat_columns)==0):
     #    print('\nWARNING: data features have not been initialized\n')
     
+    # record the size of the review and tip files before they are read
+    rev_state = input_state(in_revjson)
+    tip_state = input_state(in_tipjson)
+
     # load the restaurant objects
     print 'loading business JSON objects from %s...' % in_busjson
     objects,junk = load_restaurants(in_busjson)
 
-    # load the review and tip objects and add first/last review/tip date
-    # and census tract to objects
-    objects,reviews,tips = process_review_tip_census_data(in_revjson, in_tipjson,
-                                                          in_demoeconcsv, objects)
+    # build the business ID dictionary and add the business index to each
+    # business object, the dictionary is written next to the business file
+    bus_ids = idutils.BusinessIds([bus[fi.business_id] for bus in objects])
+    for bus in objects:
+        bus[fi.bus_idx] = bus_ids.get(bus[fi.business_id])
+    print 'writing business ID dictionary to %s...' % idutils.ids_path(out_busjson)
+    bus_ids.save(idutils.ids_path(out_busjson))
+
+    # stream the review and tip objects to the filtered files and add
+    # first/last review/tip date and census tract to objects
+    objects = process_review_tip_census_data(in_revjson, out_revjson, in_tipjson,
+                                             out_tipjson, in_demoeconcsv, objects,
+                                             bus_ids, jobs=jobs)
     
     # create feature matrix
     #feat_mat, columns = get_feature_matrix(objects, feat_columns)
@@ -519,153 +784,403 @@ def filter_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
     print 'writing business JSON object to %s...' % out_busjson
     jsonutils.save_objects(objects, out_busjson, attfilt=bus_feats)
 
-    # write review data to file
-    print 'writing review JSON objects to %s...' % out_revjson
-    jsonutils.save_objects(reviews, out_revjson, attfilt=rev_feats)
-
-    # write tip data to file
-    print 'writing tip JSON objects to %s...' % out_tipjson
-    jsonutils.save_objects(tips, out_tipjson, attfilt=tip_feats)
+    # record the state used to refresh the filtered files incrementally
+    save_filter_state(out_busjson, rev_state, tip_state)
 
 '''
 Collect the reviews and tips for the businesses in the specified list of
-business objects.  Also, add the first and last review/tip dates and census
-tract for each business in the specified list of business objects.
+business objects and write them to the filtered review and tip files.  Also,
+add the first and last review/tip dates and census tract for each business in
+the specified list of business objects.  The reviews and tips are streamed from
+the input files to the output files so only one review or tip is held in memory
+at a time.
 
 Inputs:
 
   in_revjson:
     the path to the file containing JSON review objects
 
+  out_revjson:
+    the path to the file where the filtered JSON review objects will be written
+
   in_tipjson:
     the path to the file containing JSON tip objects
 
+  out_tipjson
+    the path to the file where the filtered JSON tip objects will be written
+
   in_demoeconcsv:
     the path to the CSV file containing demographic and economic data for businesses
 
   buses
     a list of dictionaties with each dictionary representing a business
 
+  bus_ids:
+    the business ID dictionary (see idutils.BusinessIds) holding the index of
+    each business, the index is added to each review and tip that is written
+
+  jobs: (optional)
+    the number of processes used to parse the review and tip files, when
+    greater than one the files are parsed in chunks by a pool of processes and
+    only the reviews and tips for the businesses are returned by the workers,
+    -1 uses one process per CPU (default is 1)
+
 Outputs:
 
   buses
     the list of business objects with each business object augmented with its
     first and last review dates and demographic and economic data
-
-  reviews
-    the list of reviews that were written for one of the businesses identified
-    in the list of businesses passed as input
-
-  tips
-    the list of tips that were written for one of the businesses identified
-    in the list of businesses passed as input
 '''
-def process_review_tip_census_data(in_revjson, in_tipjson, in_demoeconcsv, buses):
+def process_review_tip_census_data(in_revjson, out_revjson, in_tipjson, out_tipjson,
+                                   in_demoeconcsv, buses, bus_ids, jobs=1):
     # load the census tracts
     print 'loading demographic and economic data from %s...' % in_demoeconcsv
     demo_econ_data = csvutils.load_matrix(in_demoeconcsv,False)
 
-    # initialize  dictionaries to hold the first and last review dates and
-    # add lookup data for demo & econ data
+    # initialize lists (indexed by business index) to hold the first and last
+    # review dates
     print 'initialize dictionaries...'
-    first_review_dates = {}
-    last_review_dates = {}
-    demo_econ_lookup = {}
-    for bus in buses:
-        # add the business IDs for restaurants to the dictionaries
-        bid = bus[fi.business_id]
-        first_review_dates[bid] = None
-        last_review_dates[bid] = None
-        demo_econ_lookup[bid] = -1
+    first_review_dates = [None]*len(bus_ids)
+    last_review_dates = [None]*len(bus_ids)
 
     # initialize lookup table for demo and econ data
     print 'initialize lookup table for demographic and economic data...'
-    for i in xrange(demo_econ_data.shape[0]):
-        bid = demo_econ_data[i,fi.census_bus_id_idx]
-        if (bid):
-            demo_econ_lookup[bid] = i
+    demo_econ_lookup = get_demo_econ_lookup(demo_econ_data, bus_ids)
 
-    # collect the reviews that were written for one of the businesses in the list
+    # write the reviews that were written for one of the businesses in the list
     # of businesses and identify the first/last review/tip dates for each business
-    reviews = []
     print 'processing reviews from %s...' % in_revjson
-    with open(in_revjson, 'r') as fin:
-        # there is one JSON object per line, iterate over the lines and load the JSON
-        for line in fin:
-            # load the JSON object as a dictionary
-            review = json.loads(line)
-
-            # if the review is for one of the requested businesses then update
-            # the current first/last review/tip date for that business if necessary
-            bid = review[fi.business_id]
-            if (bid in last_review_dates):
-                # append this review to the list of reviews
-                reviews.append(review)
-                # process review dates
-                review_date = date2int(str2date(review[fi.date]))
-                review[fi.date] = review_date
-                # process first and last review/tip dates
-                current_first = first_review_dates[bid]
-                current_last = last_review_dates[bid]
-                # if this review date is earlier than the current first review/tip
-                # date then set the first review/tip date to this review date
-                if (current_first is None or current_first > review_date):
-                    first_review_dates[bid] = review_date
-                # if this review date is more recent than the current last review/tip
-                # date then set the last review/tip date to this review date
-                if (current_last is None or current_last < review_date):
-                    last_review_dates[bid] = review_date
-
-    # collect the tips that were written for one of the businesses in the list
+    print 'writing review JSON objects to %s...' % out_revjson
+    with io.open(out_revjson, 'w', encoding='utf-8') as fout:
+        # load only the attributes that are written to the filtered file
+        reviews = iter_events(in_revjson, fi.rev_feat_names, bus_ids.ids, jobs)
+        reviews = filter_events(reviews, bus_ids, first_review_dates, last_review_dates)
+        jsonutils.write_objects(reviews, fout, attfilt=fi.rev_feat_names)
+
+    # write the tips that were written for one of the businesses in the list
     # of businesses and update the first/last review/tip dates for each business
-    tips = []
     print 'processing tips from %s...' % in_tipjson
-    with open(in_tipjson, 'r') as fin:
-        # there is one JSON object per line, iterate over the lines and load the JSON
-        for line in fin:
-            # load the JSON object as a dictionary
-            tip = json.loads(line)
-
-            # if the tip is for one of the requested businesses then update
-            # the current first/last review/tip date for that business if necessary
-            bid = tip[fi.business_id]
-            if (bid in last_review_dates):
-                # append this tip to the list of tips
-                tips.append(tip)
-                # process tip dates
-                tip_date = date2int(str2date(tip[fi.date]))
-                tip[fi.date] = tip_date
-                # process first and last review/tip dates
-                current_first = first_review_dates[bid]
-                current_last = last_review_dates[bid]
-                # if this tip date is earlier than the current first review/tip
-                # date then set the first review/tip date to this review date
-                if (current_first is None or current_first > tip_date):
-                    first_review_dates[bid] = tip_date
-                # if this tip date is more recent than the current last review/tip
-                # date then set the last review/tip date to this review date
-                if (current_last is None or current_last < tip_date):
-                    last_review_dates[bid] = tip_date
+    print 'writing tip JSON objects to %s...' % out_tipjson
+    with io.open(out_tipjson, 'w', encoding='utf-8') as fout:
+        # load only the attributes that are written to the filtered file
+        tips = iter_events(in_tipjson, fi.tip_feat_names, bus_ids.ids, jobs)
+        tips = filter_events(tips, bus_ids, first_review_dates, last_review_dates)
+        jsonutils.write_objects(tips, fout, attfilt=fi.tip_feat_names)
 
     # copy the last review dates and census tracts into the business objects
     print 'adding first/last review date and census tract to business objects...'
     for bus in buses:
-        bid = bus[fi.business_id]
-        first_review_date = first_review_dates[bid]
-        last_review_date = last_review_dates[bid]
-        is_closed = not bus[fi.is_open]
-        demo_econ_idx = demo_econ_lookup[bid]
-        if (first_review_date is not None):
-            bus[fi.first_review_date] = first_review_date
-        if (last_review_date is not None):
-            bus[fi.last_review_date] = last_review_date
-            if (is_closed):
-                bus[fi.close_date] = last_review_date
+        idx = bus[fi.bus_idx]
+        add_review_dates(bus, first_review_dates[idx], last_review_dates[idx])
+        demo_econ_idx = demo_econ_lookup[idx]
         if (demo_econ_idx >= 0):
             add_demo_econ_data(bus, demo_econ_data[demo_econ_idx,:])
 
-    # return the augmented business objects, list of reviews and list of tips
-    return buses, reviews, tips
+    # return the augmented business objects
+    return buses
+
+'''
+Refresh the filtered data files created by filter_yelp_data using a new drop of
+the Yelp! academic dataset.  The state recorded by the previous run (see
+save_filter_state) is used to process only the new reviews and tips:
+
+  - if a review or tip file was only appended to since the previous run then
+    only the lines after the recorded offset are read, the lines before the
+    offset are only read (for the new restaurants only) if there are new
+    restaurants
+  - otherwise the whole file is read but only the reviews (or tips) that were
+    not written before are ingested: the reviews dated before the watermark of
+    their business (the date of its last review in the filtered review file)
+    are skipped and, as dates only have day precision, the reviews dated on the
+    watermark are skipped if their key (see event_key) was written before
+
+The new reviews and tips are appended to the filtered review and tip files, new
+restaurants are added to the business ID dictionary and the first/last review
+dates and close dates of the business objects are updated before the filtered
+business file is rewritten.  If there is no recorded state then all the data is
+filtered (see filter_yelp_data).
+
+The inputs are the same as the inputs of filter_yelp_data.
+'''
+def refresh_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
+                      in_tipjson, out_tipjson, in_demoeconcsv, jobs=1):
+    state = load_filter_state(out_busjson)
+    outputs = [out_busjson, out_revjson, out_tipjson, idutils.ids_path(out_busjson)]
+    if (state is None or not all(os.path.exists(f) for f in outputs)):
+        print 'no previous filter state found, filtering all the data...'
+        filter_yelp_data(in_busjson, out_busjson, in_revjson, out_revjson,
+                         in_tipjson, out_tipjson, in_demoeconcsv, jobs=jobs)
+        return
+
+    # record the size of the review and tip files before they are read
+    rev_state = input_state(in_revjson)
+    tip_state = input_state(in_tipjson)
+
+    # load the previously filtered business objects and business ID dictionary
+    print 'loading filtered business JSON objects from %s...' % out_busjson
+    buses,junk = jsonutils.load_objects(out_busjson)
+    bus_ids = idutils.load_bus_ids(idutils.ids_path(out_busjson))
+    bus_lookup = dict((bus[fi.bus_idx], bus) for bus in buses)
+
+    # update the existing restaurants and add the new restaurants
+    print 'loading business JSON objects from %s...' % in_busjson
+    objects,junk = load_restaurants(in_busjson)
+    new_buses = []
+    for obj in objects:
+        idx = bus_ids.intern(obj[fi.business_id])
+        if (idx in bus_lookup):
+            bus_lookup[idx].update(obj)
+        else:
+            obj[fi.bus_idx] = idx
+            bus_lookup[idx] = obj
+            new_buses.append(obj)
+    print '  number of new restaurants: %d' % len(new_buses)
+
+    # initialize the first/last review dates from the business objects
+    first_review_dates = [None]*len(bus_ids)
+    last_review_dates = [None]*len(bus_ids)
+    for idx,bus in bus_lookup.iteritems():
+        first_review_dates[idx] = bus.get(fi.first_review_date, None)
+        last_review_dates[idx] = bus.get(fi.last_review_date, None)
+
+    # append the new reviews and tips to the filtered files
+    inputs = [(in_revjson, out_revjson, fi.rev_feat_names, 'reviews'),
+              (in_tipjson, out_tipjson, fi.tip_feat_names, 'tips')]
+    for in_json,out_json,keys,name in inputs:
+        start = resume_offset(in_json, state[name])
+        if (start > 0):
+            print 'processing %s appended to %s after offset %d...' % (name, in_json, start)
+            marks, seen = None, None
+        else:
+            print 'loading the watermarks of the %s in %s...' % (name, out_json)
+            marks, seen = load_watermarks(out_json, len(bus_ids))
+            print 'processing %s from %s not before the watermarks...' % (name, in_json)
+        print 'appending %s JSON objects to %s...' % (name, out_json)
+        with io.open(out_json, 'a', encoding='utf-8') as fout:
+            events = iter_events(in_json, keys, bus_ids.ids, jobs, start)
+            events = filter_events(events, bus_ids, first_review_dates, last_review_dates, marks, seen)
+            jsonutils.write_objects(events, fout, attfilt=keys)
+            # the lines before the offset were processed before the new
+            # restaurants were added so they are read again for them only
+            if (start > 0 and len(new_buses) > 0):
+                print 'processing %s for new restaurants before offset %d...' % (name, start)
+                new_index = dict((bus[fi.business_id], bus[fi.bus_idx]) for bus in new_buses)
+                events = iter_events(in_json, keys, new_index.keys(), jobs, 0, start)
+                events = filter_events(events, new_index, first_review_dates, last_review_dates)
+                jsonutils.write_objects(events, fout, attfilt=keys)
+
+    # add the demo & econ data to the new restaurants
+    if (len(new_buses) > 0):
+        print 'loading demographic and economic data from %s...' % in_demoeconcsv
+        demo_econ_data = csvutils.load_matrix(in_demoeconcsv,False)
+        demo_econ_lookup = get_demo_econ_lookup(demo_econ_data, bus_ids)
+        for bus in new_buses:
+            demo_econ_idx = demo_econ_lookup[bus[fi.bus_idx]]
+            if (demo_econ_idx >= 0):
+                add_demo_econ_data(bus, demo_econ_data[demo_econ_idx,:])
+
+    # update the first/last review dates and close dates
+    print 'updating first/last review date of business objects...'
+    buses = [bus_lookup[idx] for idx in sorted(bus_lookup.keys())]
+    for bus in buses:
+        idx = bus[fi.bus_idx]
+        add_review_dates(bus, first_review_dates[idx], last_review_dates[idx])
+
+    # write the business objects, business ID dictionary and state to file
+    print 'writing business JSON object to %s...' % out_busjson
+    jsonutils.save_objects(buses, out_busjson, attfilt=fi.bus_feat_names)
+    bus_ids.save(idutils.ids_path(out_busjson))
+    save_filter_state(out_busjson, rev_state, tip_state)
+# end refresh_yelp_data
+
+'''
+Add the first and last review/tip dates to the business object.  The close date
+of a closed business is its last review/tip date.
+'''
+def add_review_dates(bus, first_review_date, last_review_date):
+    if (first_review_date is not None):
+        bus[fi.first_review_date] = first_review_date
+    if (last_review_date is not None):
+        bus[fi.last_review_date] = last_review_date
+        if (not bus[fi.is_open]):
+            bus[fi.close_date] = last_review_date
+        else:
+            bus.pop(fi.close_date, None)
+
+'''
+Return a list (indexed by business index) holding the row of the demographic
+and economic data for each business (-1 if there is no data for the business).
+'''
+def get_demo_econ_lookup(demo_econ_data, bus_ids):
+    demo_econ_lookup = [-1]*len(bus_ids)
+    for i in xrange(demo_econ_data.shape[0]):
+        idx = bus_ids.get(demo_econ_data[i,fi.census_bus_id_idx])
+        if (idx is not None):
+            demo_econ_lookup[idx] = i
+    return demo_econ_lookup
+
+# ==================================================
+# Functions to record the state of the filtered data files
+# ==================================================
+'''
+Return the path of the filter state file stored next to the specified filtered
+business file (<out_busjson>.state), the name is derived from the name of the
+business file so filtered files written to the same directory don't share a
+state.
+'''
+def filter_state_path(out_busjson):
+    return os.path.abspath(out_busjson) + filter_state_ext
+
+'''
+Return the state of an input file: its size (the offset up to which it is
+processed) and a hash of the bytes before that offset.
+'''
+def input_state(file_path):
+    size = os.path.getsize(file_path)
+    return {'offset': size, 'tail_sha1': tail_hash(file_path, size)}
+
+'''
+Return the sha1 hash of the (at most) tail_bytes bytes before the offset.
+'''
+def tail_hash(file_path, offset):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as fin:
+        fin.seek(max(offset - tail_bytes, 0))
+        h.update(fin.read(min(offset, tail_bytes)))
+    return h.hexdigest()
+
+'''
+Return the offset where processing of the input file can resume, this is the
+recorded offset if the file was only appended to since its state was recorded
+and 0 otherwise.
+'''
+def resume_offset(file_path, file_state):
+    offset = file_state['offset']
+    if (os.path.getsize(file_path) >= offset and
+        tail_hash(file_path, offset) == file_state['tail_sha1']):
+        return offset
+    return 0
+
+'''
+Write the filter state: the state of the review and tip files.
+'''
+def save_filter_state(out_busjson, rev_state, tip_state):
+    state = {'reviews': rev_state, 'tips': tip_state}
+    path = filter_state_path(out_busjson)
+    with open(path + '.tmp', 'w') as fout:
+        json.dump(state, fout)
+    os.rename(path + '.tmp', path)
+
+'''
+Load the filter state written next to the specified filtered business file.
+Returns None if there is no filter state.
+'''
+def load_filter_state(out_busjson):
+    path = filter_state_path(out_busjson)
+    if (not os.path.exists(path)):
+        return None
+    with open(path, 'r') as fin:
+        return json.load(fin)
+
+'''
+Return the key that identifies a review or tip object: the review ID of a
+review and the user ID and date of a tip (the filtered tips don't have an ID or
+the text of the tip).
+'''
+def event_key(event):
+    if (fi.review_id in event):
+        return event[fi.review_id]
+    return (event[fi.user_id], event[fi.date])
+
+'''
+Load the watermarks of the reviews or tips in the specified filtered file.
+Returns the watermarks (the date of the most recent object of each business, a
+list indexed by business index) and the keys (see event_key) of the objects on
+the watermark date of each business (a dictionary mapping business indices to
+counters of keys).
+'''
+def load_watermarks(out_json, num_buses):
+    watermarks = [None]*num_buses
+    seen = {}
+    with open(out_json, 'r') as fin:
+        for event in jsonutils.iter_projected(fin, [fi.bus_idx, fi.date, fi.review_id, fi.user_id]):
+            idx = event[fi.bus_idx]
+            event_date = event[fi.date]
+            if (watermarks[idx] is None or watermarks[idx] < event_date):
+                watermarks[idx] = event_date
+                seen[idx] = collections.Counter()
+            if (watermarks[idx] == event_date):
+                seen[idx][event_key(event)] += 1
+    return watermarks, seen
+
+'''
+Generator that yields the specified attributes of the review or tip objects in
+the specified file.  If more than one job is requested then the file is parsed
+in parallel and the objects for businesses that are not in the specified
+collection of business IDs are dropped by the worker processes.  Reading starts
+at the specified byte offset and stops at the end offset (or the end of the
+file if the end offset is None).
+'''
+def iter_events(file_path, keys, bids, jobs=1, start=0, end=None):
+    if (jobs != 1):
+        filt = {fi.business_id: set(bids)}
+        for event in jsonutils.iter_parallel(file_path, filt, keys, jobs, start, end):
+            yield event
+    else:
+        with open(file_path, 'r') as fin:
+            if (end is None):
+                fin.seek(start)
+                lines = fin
+            else:
+                lines = jsonutils.iter_chunk_lines(fin, start, end)
+            for event in jsonutils.iter_projected(lines, keys):
+                yield event
+
+'''
+Generator that yields the review or tip objects that were written for one of
+the businesses in the business ID dictionary (or any other mapping from
+business IDs to business indices).  The business index is added to
+each yielded object, its date is converted to seconds since the epoch and the
+first and last review/tip dates of its business (lists indexed by business
+index) are updated if necessary.  If watermarks and keys (see load_watermarks)
+are specified then the objects dated before the watermark of their business
+are dropped, as are the objects dated on the watermark whose key was seen
+before (each key that was seen n times drops n objects).
+'''
+def filter_events(events, bus_ids, first_review_dates, last_review_dates, watermarks=None, seen=None):
+    for event in events:
+        # if the event is for one of the requested businesses then update
+        # the current first/last review/tip date for that business if necessary
+        idx = bus_ids.get(event[fi.business_id])
+        if (idx is not None):
+            event[fi.bus_idx] = idx
+            # process event dates
+            event_date = dateutils.str2int(event[fi.date])
+            event[fi.date] = event_date
+            # skip events that were processed before, the dates only have day
+            # precision so the events on the watermark date are matched by key
+            if (watermarks is not None and watermarks[idx] is not None):
+                if (event_date < watermarks[idx]):
+                    continue
+                if (event_date == watermarks[idx]):
+                    keys = seen[idx]
+                    key = event_key(event)
+                    if (keys[key] > 0):
+                        keys[key] -= 1
+                        continue
+            # process first and last review/tip dates
+            current_first = first_review_dates[idx]
+            current_last = last_review_dates[idx]
+            # if this event date is earlier than the current first review/tip
+            # date then set the first review/tip date to this event date
+            if (current_first is None or current_first > event_date):
+                first_review_dates[idx] = event_date
+            # if this event date is more recent than the current last review/tip
+            # date then set the last review/tip date to this event date
+            if (current_last is None or current_last < event_date):
+                last_review_dates[idx] = event_date
+            yield event
+# end filter_events
 
 '''
 Add the demographic and economic data contained in the supplied vector
@@ -694,7 +1209,8 @@ def add_demo_econ_data(bus, demo_econ_data):
 # Functions to load JSON objects from JSON files
 # ==================================================
 '''
-Load restaurant objects from the specified JSON file path.
+Load restaurant objects from the specified JSON file path.  Only the business
+features (see feat_info.bus_feat_names) are loaded.
 
 Inputs:
 
@@ -710,22 +1226,22 @@ Outputs:
     list of keys that can be used to access JSON object attributes
 '''
 def load_restaurants(file_path):
-    return jsonutils.load_objects(file_path, filt=fi.restaurant_filter)
+    return jsonutils.load_projected(file_path, fi.bus_feat_names, filt=fi.restaurant_filter)
 
 # ==================================================
-# Functions to convert data
+# Functions to convert data (see dateutils, all conversions are done in UTC)
 # ==================================================
 def str2date(datestr):
-    return time.strptime(datestr, '%Y-%m-%d')
+    return dateutils.str2date(datestr)
 
 def date2str(date):
-    return time.strftime('%Y-%m-%d', date)
+    return dateutils.date2str(date)
 
 def date2int(d):
-    return int(time.mktime(d))
+    return dateutils.date2int(d)
 
 def int2date(secs):
-    return time.localtime(secs)
+    return dateutils.int2date(secs)
 
 # ==================================================
 # Math functions
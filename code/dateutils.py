@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+This modules provides utility functions for converting the dates in the Yelp!
+academic dataset ('YYYY-MM-DD' strings) to integers expressed as seconds since
+the epoch and back.  All conversions are done in UTC so the results don't
+depend on the local timezone.
+
+The Yelp! data contains only a few thousand distinct dates, so the conversion
+of single date strings is memoized and columns of date strings are converted
+in bulk by converting each distinct date once.
+"""
+
+import time
+import calendar
+import numpy as np
+
+# format of the date strings
+date_fmt = '%Y-%m-%d'
+
+# memo table mapping date strings to seconds since the epoch
+date_memo = {}
+
+# ==================================================
+# Scalar conversion functions
+# ==================================================
+'''
+Convert a date string to a time.struct_time.
+'''
+def str2date(datestr):
+    return time.strptime(datestr, date_fmt)
+
+'''
+Convert a time.struct_time to a date string.
+'''
+def date2str(date):
+    return time.strftime(date_fmt, date)
+
+'''
+Convert a time.struct_time (interpreted as UTC) to seconds since the epoch.
+'''
+def date2int(d):
+    return calendar.timegm(d)
+
+'''
+Convert seconds since the epoch to a time.struct_time in UTC.
+'''
+def int2date(secs):
+    return time.gmtime(secs)
+
+'''
+Convert a date string to seconds since the epoch (UTC).  The result for each
+distinct date string is memoized.
+'''
+def str2int(datestr):
+    secs = date_memo.get(datestr, None)
+    if (secs is None):
+        secs = date_memo[datestr] = date2int(str2date(datestr))
+    return secs
+
+'''
+Convert seconds since the epoch to a date string (UTC).
+'''
+def int2str(secs):
+    return date2str(int2date(secs))
+
+# ==================================================
+# Bulk conversion functions
+# ==================================================
+'''
+Convert a sequence (list or numpy array) of date strings to a numpy int64 array
+of seconds since the epoch (UTC).  Each distinct date string is converted once
+using numpy datetime64.
+
+Inputs:
+
+  datestrs:
+    sequence of 'YYYY-MM-DD' date strings
+
+Outputs:
+
+  secs:
+    numpy int64 array holding the seconds since the epoch for each date string
+'''
+def strs2ints(datestrs):
+    datestrs = np.asarray(datestrs)
+    if (datestrs.size == 0):
+        return np.zeros(datestrs.shape, dtype=np.int64)
+    # convert each distinct date string once
+    distinct, inverse = np.unique(datestrs, return_inverse=True)
+    days = distinct.astype('datetime64[D]')
+    secs = days.astype('datetime64[s]').astype(np.int64)
+    return secs[inverse].reshape(datestrs.shape)
+
+'''
+Convert a numpy array of seconds since the epoch to an array of date strings
+(UTC).
+'''
+def ints2strs(secs):
+    days = np.asarray(secs, dtype=np.int64).astype('datetime64[s]').astype('datetime64[D]')
+    return days.astype(str)
@@ -0,0 +1,724 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a columnar store for the review, tip and sentiment events
+used to generate data sets.  Rather than keeping one python dictionary per
+review or tip, each event type is held as a set of typed numpy arrays with one
+entry per event:
+
+  reviews   - business index (int32), date (int64), stars (int8)
+  tips      - business index (int32), date (int64), likes (int16)
+  sentiment - business index (int32), date (int64), sentiment rank (int8)
+
+The business index is the position of the business in the list of business
+objects used to create the store.
+"""
+
+import os
+import csv
+import array
+import itertools
+import numpy as np
+import feat_info as fi
+import jsonutils as ju
+import datautils as du
+import dateutils
+import idutils
+import partutils
+
+# data types used for the event columns
+bus_idx_dtype = np.int32
+date_dtype = np.int64
+stars_dtype = np.int8
+likes_dtype = np.int16
+senti_rank_dtype = np.int8
+
+'''
+Columnar store holding the review, tip and sentiment events for a list of
+businesses.  Each of the reviews, tips and senti attributes is a dictionary
+mapping the column names to numpy arrays:
+
+  reviews:
+    fi.bus_idx, fi.date and fi.stars
+
+  tips:
+    fi.bus_idx, fi.date and fi.likes
+
+  senti:
+    fi.bus_idx, fi.date and fi.senti_rank
+'''
+class EventStore(object):
+    def __init__(self, bus_ids, reviews=None, tips=None, senti=None):
+        # the business IDs in business index order
+        self.bus_ids = list(bus_ids)
+        # mapping from business ID to business index
+        self.bus_index = dict((bid,i) for i,bid in enumerate(self.bus_ids))
+        # the event columns
+        self.reviews = reviews
+        self.tips = tips
+        self.senti = senti
+        # index and incremental aggregator used to answer queries for multiple
+        # prediction dates, they are created the first time they are requested
+        self.index = None
+        self.incremental = None
+
+    '''
+    Return the number of businesses in the store.
+    '''
+    def num_buses(self):
+        return len(self.bus_ids)
+
+    '''
+    Return a dictionary mapping business indices to the business objects in
+    the supplied dictionary of business objects (keyed by business ID).
+    Businesses that are not in the store are ignored.
+    '''
+    def lookup(self, buses):
+        bus_lookup = {}
+        for bid,bus in buses.iteritems():
+            idx = self.bus_index.get(bid, None)
+            if (idx is not None):
+                bus_lookup[idx] = bus
+        return bus_lookup
+
+    '''
+    Iterate over the reviews as (business index, date, stars) tuples.
+    '''
+    def iter_reviews(self):
+        return iter_columns(self.reviews, fi.stars)
+
+    '''
+    Iterate over the tips as (business index, date, likes) tuples.
+    '''
+    def iter_tips(self):
+        return iter_columns(self.tips, fi.likes)
+
+    '''
+    Iterate over the sentiment ranks as (business index, date, rank) tuples.
+    '''
+    def iter_senti(self):
+        return iter_columns(self.senti, fi.senti_rank)
+
+    '''
+    Aggregate the events that were available on the prediction date for every
+    business.  See aggregate_events.
+    '''
+    def aggregate(self, pdate):
+        return aggregate_events(self, pdate)
+
+    '''
+    Return the EventIndex for the events in the store, the index is created
+    the first time this method is called.  The index must be recreated (by
+    setting the index attribute to None) if the event columns are modified.
+    '''
+    def get_index(self):
+        if (self.index is None):
+            self.index = EventIndex(self)
+        return self.index
+
+    '''
+    Return the IncrementalAggregator for the events in the store, the
+    aggregator is created the first time this method is called.  As with the
+    index, it must be recreated if the event columns are modified.
+    '''
+    def get_incremental(self):
+        if (self.incremental is None):
+            self.incremental = IncrementalAggregator(self)
+        return self.incremental
+
+'''
+Iterate over the rows of a dictionary of event columns as (business index,
+date, value) tuples.  The values are python ints rather than numpy scalars
+so they can be stored in the business objects and serialized as JSON.
+'''
+def iter_columns(columns, value_key):
+    return itertools.izip(columns[fi.bus_idx].tolist(),
+                          columns[fi.date].tolist(),
+                          columns[value_key].tolist())
+
+# ==================================================
+# Functions to aggregate events
+# ==================================================
+'''
+Calculate the review, tip and sentiment aggregates used in generated data sets
+for every business in the event store using numpy.  The quarter for each event
+is found with a binary search of the quarter boundaries and the per-business
+values are calculated with np.bincount keyed by business index.
+
+Inputs:
+
+  events:
+    the EventStore holding the events
+
+  pdate:
+    the prediction date (an int expressed as seconds since the epoch)
+
+Outputs:
+
+  aggs:
+    dictionary mapping the following attribute names to numpy arrays holding
+    the value of the attribute for each business index:
+      fi.review_count, fi.star_total, fi.qtr_review_count[q], fi.qtr_star_total[q],
+      fi.tip_count, fi.qtr_tip_count[q], fi.senti_count and fi.senti_total
+'''
+def aggregate_events(events, pdate):
+    B = events.num_buses()
+    qtr_boundary = np.array(du.get_qtr_boundary(pdate), dtype=date_dtype)
+    aggs = {}
+
+    # reviews submitted on or before the prediction date
+    reviews = events.reviews
+    mask = reviews[fi.date] <= pdate
+    bus_idx = reviews[fi.bus_idx][mask]
+    rdate = reviews[fi.date][mask]
+    stars = reviews[fi.stars][mask]
+    aggs[fi.review_count] = np.bincount(bus_idx, minlength=B)
+    aggs[fi.star_total] = weighted_bincount(bus_idx, stars, B)
+    qtr_counts, qtr_totals = qtr_bincount(bus_idx, rdate, qtr_boundary, B, stars)
+    for qtr in xrange(4):
+        aggs[fi.qtr_review_count[qtr]] = qtr_counts[:,qtr]
+        aggs[fi.qtr_star_total[qtr]] = qtr_totals[:,qtr]
+
+    # tips submitted on or before the prediction date
+    tips = events.tips
+    mask = tips[fi.date] <= pdate
+    bus_idx = tips[fi.bus_idx][mask]
+    tdate = tips[fi.date][mask]
+    aggs[fi.tip_count] = np.bincount(bus_idx, minlength=B)
+    qtr_counts, junk = qtr_bincount(bus_idx, tdate, qtr_boundary, B)
+    for qtr in xrange(4):
+        aggs[fi.qtr_tip_count[qtr]] = qtr_counts[:,qtr]
+
+    # sentiment ranks for reviews and tips submitted in the last six months
+    senti = events.senti
+    mask = (senti[fi.date] > qtr_boundary[2]) & (senti[fi.date] <= pdate)
+    bus_idx = senti[fi.bus_idx][mask]
+    aggs[fi.senti_count] = np.bincount(bus_idx, minlength=B)
+    aggs[fi.senti_total] = weighted_bincount(bus_idx, senti[fi.senti_rank][mask], B)
+
+    return aggs
+# end aggregate_events
+
+# ==================================================
+# Index used to aggregate events for many dates
+# ==================================================
+'''
+Index of the events in an event store that can be used to calculate the same
+aggregates as aggregate_events for any prediction date without scanning the
+events.  The events are sorted by (business index, date) and cumulative counts
+and value totals are kept, so the number of events (and the value total) for a
+business up to a date is found with a binary search and a subtraction.
+Calculating the aggregates for a prediction date costs O(B log N) where B is
+the number of businesses and N is the number of events.
+'''
+class EventIndex(object):
+    def __init__(self, events):
+        B = events.num_buses()
+        self.reviews = SortedEvents(events.reviews, B, fi.stars)
+        self.tips = SortedEvents(events.tips, B)
+        self.senti = SortedEvents(events.senti, B, fi.senti_rank)
+
+    '''
+    Calculate the review, tip and sentiment aggregates for every business for
+    the specified prediction date.  See aggregate_events.
+    '''
+    def aggregate(self, pdate):
+        qtr_boundary = du.get_qtr_boundary(pdate)
+        aggs = {}
+
+        # reviews submitted on or before the prediction date
+        pos = [self.reviews.positions(d) for d in qtr_boundary]
+        aggs[fi.review_count] = self.reviews.count_before(pos[4])
+        aggs[fi.star_total] = self.reviews.total_before(pos[4])
+        for qtr in xrange(4):
+            aggs[fi.qtr_review_count[qtr]] = self.reviews.count(pos[qtr], pos[qtr+1])
+            aggs[fi.qtr_star_total[qtr]] = self.reviews.total(pos[qtr], pos[qtr+1])
+
+        # tips submitted on or before the prediction date
+        pos = [self.tips.positions(d) for d in qtr_boundary]
+        aggs[fi.tip_count] = self.tips.count_before(pos[4])
+        for qtr in xrange(4):
+            aggs[fi.qtr_tip_count[qtr]] = self.tips.count(pos[qtr], pos[qtr+1])
+
+        # sentiment ranks for reviews and tips submitted in the last six months
+        pos_start = self.senti.positions(qtr_boundary[2])
+        pos_end = self.senti.positions(pdate)
+        aggs[fi.senti_count] = self.senti.count(pos_start, pos_end)
+        aggs[fi.senti_total] = self.senti.total(pos_start, pos_end)
+
+        return aggs
+# end EventIndex
+
+'''
+The events of one type (reviews, tips or sentiment ranks) sorted by (business
+index, date) along with the cumulative totals of the event values.
+
+The events are located using a single sorted array of keys that combines the
+business index and the date:
+
+  key = bus_idx*span + (date - min_date + 1)
+
+so the positions of the events on or before a date can be found for all
+businesses with a single call to np.searchsorted.
+'''
+class SortedEvents(object):
+    def __init__(self, columns, B, value_key=None):
+        bus_idx = columns[fi.bus_idx].astype(np.int64)
+        dates = columns[fi.date].astype(np.int64)
+        order = np.lexsort((dates, bus_idx))
+        bus_idx = bus_idx[order]
+        dates = dates[order]
+
+        # the range of dates covered by the keys
+        if (len(dates) > 0):
+            self.min_date = dates.min()
+            max_date = dates.max()
+        else:
+            self.min_date = max_date = 0
+        self.span = max_date - self.min_date + 2
+
+        # the sorted keys and the key prefix for each business
+        self.keys = bus_idx*self.span + (dates - self.min_date + 1)
+        self.bus_keys = np.arange(B, dtype=np.int64)*self.span
+
+        # the position of the first event for each business
+        counts = np.bincount(bus_idx, minlength=B)
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+        # cumulative totals of the event values, cum_values[i] is the total of
+        # the values of the first i events
+        self.cum_values = None
+        if (value_key is not None):
+            values = columns[value_key][order].astype(np.int64)
+            self.cum_values = np.concatenate(([0], np.cumsum(values)))
+
+    '''
+    Return an array with the position following the last event on or before
+    the specified date for each business.
+    '''
+    def positions(self, date):
+        offset = min(max(date - self.min_date + 1, 0), self.span - 1)
+        return np.searchsorted(self.keys, self.bus_keys + offset, side='right')
+
+    '''
+    Return the number of events for each business between two sets of positions.
+    '''
+    def count(self, pos_start, pos_end):
+        return pos_end - pos_start
+
+    '''
+    Return the total of the event values for each business between two sets
+    of positions.
+    '''
+    def total(self, pos_start, pos_end):
+        return self.cum_values[pos_end] - self.cum_values[pos_start]
+
+    '''
+    Return the number of events for each business before the positions.
+    '''
+    def count_before(self, pos):
+        return self.count(self.starts, pos)
+
+    '''
+    Return the total of the event values for each business before the positions.
+    '''
+    def total_before(self, pos):
+        return self.total(self.starts, pos)
+# end SortedEvents
+
+# ==================================================
+# Incremental aggregation for walking forward
+# ==================================================
+'''
+Aggregator that calculates the same aggregates as aggregate_events but keeps
+running per-business accumulators between calls.  This is intended for walk
+forward cross validation where consecutive prediction dates differ by a fixed
+time delta.
+
+An accumulator (cumulative per-business counts and value totals) is kept for
+each of the five quarter boundaries of the current prediction date.  When the
+prediction date moves, each accumulator is advanced by adding only the events
+that fall between its old and new boundary (events are subtracted if the date
+moves backwards), and the quarterly buckets are the differences between
+consecutive accumulators.  The cost of walking forward therefore grows with
+the number of events rather than with the number of events times the number
+of prediction dates.
+'''
+class IncrementalAggregator(object):
+    def __init__(self, events):
+        B = events.num_buses()
+        self.reviews = RunningTotals(events.reviews, B, fi.stars)
+        self.tips = RunningTotals(events.tips, B)
+        self.senti = RunningTotals(events.senti, B, fi.senti_rank)
+
+    '''
+    Calculate the review, tip and sentiment aggregates for every business for
+    the specified prediction date.  See aggregate_events.
+    '''
+    def aggregate(self, pdate):
+        qtr_boundary = du.get_qtr_boundary(pdate)
+        aggs = {}
+
+        # reviews submitted on or before the prediction date
+        acc = [self.reviews.advance(i, d) for i,d in enumerate(qtr_boundary)]
+        aggs[fi.review_count] = acc[4][0].copy()
+        aggs[fi.star_total] = acc[4][1].copy()
+        for qtr in xrange(4):
+            aggs[fi.qtr_review_count[qtr]] = acc[qtr+1][0] - acc[qtr][0]
+            aggs[fi.qtr_star_total[qtr]] = acc[qtr+1][1] - acc[qtr][1]
+
+        # tips submitted on or before the prediction date
+        acc = [self.tips.advance(i, d) for i,d in enumerate(qtr_boundary)]
+        aggs[fi.tip_count] = acc[4][0].copy()
+        for qtr in xrange(4):
+            aggs[fi.qtr_tip_count[qtr]] = acc[qtr+1][0] - acc[qtr][0]
+
+        # sentiment ranks for reviews and tips submitted in the last six months
+        acc_start = self.senti.advance(2, qtr_boundary[2])
+        acc_end = self.senti.advance(4, qtr_boundary[4])
+        aggs[fi.senti_count] = acc_end[0] - acc_start[0]
+        aggs[fi.senti_total] = acc_end[1] - acc_start[1]
+
+        return aggs
+# end IncrementalAggregator
+
+'''
+The events of one type sorted by date along with a set of cursors.  Each
+cursor has a date, the number of events on or before that date and running
+per-business event counts and value totals for those events.
+'''
+class RunningTotals(object):
+    def __init__(self, columns, B, value_key=None):
+        order = np.argsort(columns[fi.date], kind='mergesort')
+        self.dates = columns[fi.date][order]
+        self.bus_idx = columns[fi.bus_idx][order]
+        self.values = None
+        if (value_key is not None):
+            self.values = columns[value_key][order]
+        self.B = B
+        # the cursors - one for each quarter boundary
+        self.cursors = {}
+
+    '''
+    Move the specified cursor to the specified date and return its per-business
+    (counts, totals) arrays for the events on or before the date.  The totals
+    are None if the events have no values.
+    '''
+    def advance(self, cursor, date):
+        if (cursor not in self.cursors):
+            totals = None
+            if (self.values is not None):
+                totals = np.zeros(self.B, dtype=np.int64)
+            self.cursors[cursor] = [0, np.zeros(self.B, dtype=np.int64), totals]
+        state = self.cursors[cursor]
+        pos = state[0]
+        new_pos = np.searchsorted(self.dates, date, side='right')
+
+        # add (or subtract) the events between the old and new positions
+        if (new_pos != pos):
+            sign = 1 if (new_pos > pos) else -1
+            lo = min(pos, new_pos)
+            hi = max(pos, new_pos)
+            bus_idx = self.bus_idx[lo:hi]
+            state[1] += sign*np.bincount(bus_idx, minlength=self.B)
+            if (self.values is not None):
+                state[2] += sign*weighted_bincount(bus_idx, self.values[lo:hi], self.B)
+            state[0] = new_pos
+
+        return state[1], state[2]
+# end RunningTotals
+
+'''
+Calculate the per-business counts (and optionally totals of the supplied
+values) for each of the four quarters prior to the prediction date.  The
+results are BxK arrays where B is the number of businesses and K is four.
+'''
+def qtr_bincount(bus_idx, dates, qtr_boundary, B, values=None):
+    # qtr_boundary[q] < date <= qtr_boundary[q+1] for events in quarter q
+    qtr = np.searchsorted(qtr_boundary, dates, side='left') - 1
+    in_qtr = (qtr >= 0) & (qtr < 4)
+    # combine the business index and quarter into a single key
+    keys = bus_idx[in_qtr].astype(np.int64)*4 + qtr[in_qtr]
+    counts = np.bincount(keys, minlength=4*B).reshape((B,4))
+    totals = None
+    if (values is not None):
+        totals = weighted_bincount(keys, values[in_qtr], 4*B).reshape((B,4))
+    return counts, totals
+
+'''
+Calculate the per-key totals of the supplied integer values.
+'''
+def weighted_bincount(keys, values, minlength):
+    totals = np.bincount(keys, weights=values, minlength=minlength)
+    return np.rint(totals).astype(np.int64)
+
+# ==================================================
+# Functions to load events into an event store
+# ==================================================
+'''
+Load the review, tip and sentiment events for the specified businesses into an
+event store.
+
+Inputs:
+
+  all_buses:
+    the list of JSON business objects, the position of a business in this list
+    is used as its business index
+
+  revjson:
+    the path to the file containing the filtered JSON review objects
+
+  tipjson:
+    the path to the file containing the filtered JSON tip objects
+
+  senticsv:
+    the path to the CSV file containing the sentiment ranks
+
+Outputs:
+
+  events:
+    an EventStore holding the events for the businesses in all_buses, events
+    for other businesses are skipped
+'''
+def load_events(all_buses, revjson, tipjson, senticsv):
+    # if the businesses were read from a filtered business file then the store
+    # uses their business indices and the indices stored in the filtered review
+    # and tip objects can be used as is
+    bus_ids, stored_idx = idutils.from_buses(all_buses)
+    events = EventStore(bus_ids.ids)
+    use_idx = events.num_buses() if (stored_idx) else None
+
+    print 'loading review events from %s...' % revjson
+    with open(revjson, 'r') as fin:
+        events.reviews = read_event_columns(fin, events.bus_index, fi.stars, stars_dtype, use_idx)
+
+    print 'loading tip events from %s...' % tipjson
+    with open(tipjson, 'r') as fin:
+        events.tips = read_event_columns(fin, events.bus_index, fi.likes, likes_dtype, use_idx)
+
+    print 'loading sentiment ranks from %s...' % senticsv
+    events.senti = load_senti_columns(senticsv, events.bus_index)
+
+    return events
+# end load_events
+
+'''
+Load the review, tip and sentiment events for the specified businesses into an
+event store from partitioned data (see partutils.write_partitions).  Only the
+partitions for the requested states with a month on or before the month of
+end_date are read.
+
+Inputs:
+
+  all_buses:
+    the list of JSON business objects, the position of a business in this list
+    is used as its business index
+
+  part_dir:
+    the directory where the partitions are stored
+
+  states: (optional)
+    list of the states to load, if None then all states are loaded
+
+  end_date: (optional)
+    the latest date (seconds since the epoch) for which events are needed, if
+    None then events for all dates are loaded
+
+Outputs:
+
+  events:
+    an EventStore holding the events for the businesses in all_buses, events
+    for other businesses are skipped
+'''
+def load_partitioned_events(all_buses, part_dir, states=None, end_date=None):
+    bus_ids, stored_idx = idutils.from_buses(all_buses)
+    events = EventStore(bus_ids.ids)
+    use_idx = events.num_buses() if (stored_idx) else None
+    manifest = partutils.load_manifest(part_dir)
+
+    for kind,value_key,value_dtype in [('reviews', fi.stars, stars_dtype),
+                                       ('tips', fi.likes, likes_dtype)]:
+        paths = partutils.select_partitions(part_dir, kind, states, end_date=end_date, manifest=manifest)
+        print 'loading %s events from %d partitions in %s...' % (kind, len(paths), part_dir)
+        parts = []
+        for path in paths:
+            with open(path, 'r') as fin:
+                parts.append(read_event_columns(fin, events.bus_index, value_key, value_dtype, use_idx))
+        setattr(events, kind, concat_columns(parts, [fi.bus_idx, fi.date, value_key],
+                                             [bus_idx_dtype, date_dtype, value_dtype]))
+
+    paths = partutils.select_partitions(part_dir, 'senti', states, end_date=end_date, manifest=manifest)
+    print 'loading sentiment ranks from %d partitions in %s...' % (len(paths), part_dir)
+    # the partitions are small so no binary sidecar files are written next to
+    # them in the partition directory
+    parts = [load_senti_columns(path, events.bus_index, sidecar=False) for path in paths]
+    events.senti = concat_columns(parts, [fi.bus_idx, fi.date, fi.senti_rank],
+                                  [bus_idx_dtype, date_dtype, senti_rank_dtype])
+
+    return events
+# end load_partitioned_events
+
+'''
+Read events from a file object containing filtered JSON objects (one per line)
+into a dictionary of typed columns.
+
+Inputs:
+
+  fin:
+    a file object from which JSON objects can be loaded
+
+  bus_index:
+    mapping from business ID to business index, events for businesses that
+    are not in the mapping are skipped
+
+  value_key:
+    the name of the attribute holding the event value (e.g. stars or likes)
+
+  value_dtype:
+    the numpy data type used to store the event value
+
+  num_buses: (optional)
+    if specified then the business indices stored in the objects (see
+    feat_info.bus_idx) are used instead of looking up the business IDs, indices
+    that are not less than num_buses are skipped, objects without a business
+    index are looked up by business ID
+
+Outputs:
+
+  columns:
+    dictionary mapping fi.bus_idx, fi.date and value_key to numpy arrays
+'''
+def read_event_columns(fin, bus_index, value_key, value_dtype, num_buses=None):
+    # compact buffers used to collect the column values
+    bus_col = array.array('i')
+    date_col = array.array('l')
+    value_col = array.array('l')
+    # only decode the attributes that are needed
+    keys = [fi.business_id, fi.date, value_key]
+    if (num_buses is not None):
+        keys.append(fi.bus_idx)
+    for obj in ju.iter_projected(fin, keys):
+        idx = obj.get(fi.bus_idx, None)
+        if (idx is None):
+            idx = bus_index.get(obj[fi.business_id], None)
+        elif (idx >= num_buses):
+            idx = None
+        if (idx is None):
+            continue
+        bus_col.append(idx)
+        date_col.append(obj[fi.date])
+        value_col.append(obj.get(value_key, 0) or 0)
+
+    return make_columns(bus_col, date_col, value_col, value_key, value_dtype)
+
+'''
+Load sentiment ranks from the specified CSV file (date, business ID, rank)
+into a dictionary of typed columns keyed by business index.  Ranks for
+businesses that are not in the mapping are skipped.  See load_senti.
+'''
+def load_senti_columns(senticsv, bus_index, sidecar=True):
+    senti = load_senti(senticsv, sidecar)
+
+    # map each distinct business ID to its business index (-1 if not present)
+    ids, inverse = np.unique(senti[fi.business_id], return_inverse=True)
+    idx_map = np.array([bus_index.get(bid, -1) for bid in ids.tolist()], dtype=bus_idx_dtype)
+    bus_col = idx_map[inverse] if (len(ids) > 0) else np.zeros(0, dtype=bus_idx_dtype)
+    keep = np.flatnonzero(bus_col >= 0)
+
+    columns = {}
+    columns[fi.bus_idx] = bus_col[keep]
+    columns[fi.date] = senti[fi.date][keep]
+    columns[fi.senti_rank] = senti[fi.senti_rank][keep]
+    return columns
+
+'''
+Load the sentiment ranks from the specified CSV file (date, business ID, rank)
+into a dictionary of typed columns.  The date strings are converted to seconds
+since the epoch in bulk (see dateutils.strs2ints) and the typed columns
+can be stored in a binary sidecar file next to the CSV file so later loads
+don't have to parse the CSV file at all.  The dictionary can be passed to
+datautils.gen_dataset in place of the sentiment matrix.
+
+Inputs:
+
+  senticsv:
+    the path to the CSV file holding the sentiment ranks
+
+  sidecar: (optional)
+    whether the binary sidecar file (<senticsv>.npz) should be used, it is
+    read if it is newer than the CSV file and written otherwise (default is
+    True)
+
+Outputs:
+
+  columns:
+    dictionary mapping fi.business_id (string array), fi.date (int64 seconds
+    since the epoch) and fi.senti_rank (int8) to numpy arrays
+'''
+def load_senti(senticsv, sidecar=True):
+    sidecar_path = senticsv + '.npz'
+    if (sidecar and os.path.exists(sidecar_path) and
+        os.path.getmtime(sidecar_path) >= os.path.getmtime(senticsv)):
+        with np.load(sidecar_path) as data:
+            return {fi.business_id: data['ids'][data['codes']],
+                    fi.date: data['dates'],
+                    fi.senti_rank: data['ranks']}
+
+    ids = []
+    id_codes = {}
+    code_col = array.array('i')
+    date_strs = []
+    rank_col = array.array('l')
+    with open(senticsv, 'rbU') as fin:
+        for row in csv.reader(fin):
+            bid = row[fi.senti_bus_idx]
+            code = id_codes.get(bid, None)
+            if (code is None):
+                code = id_codes[bid] = len(ids)
+                ids.append(bid)
+            code_col.append(code)
+            date_strs.append(row[fi.senti_date_idx])
+            rank_col.append(int(row[fi.senti_rank_idx]))
+
+    ids = np.array(ids, dtype=str) if (len(ids) > 0) else np.zeros(0, dtype='S1')
+    codes = buffer2array(code_col, np.int32)
+    dates = dateutils.strs2ints(date_strs).astype(date_dtype)
+    ranks = buffer2array(rank_col, senti_rank_dtype)
+
+    if (sidecar):
+        # write to a temporary file first so that readers never see a partial file
+        tmp_path = sidecar_path + '.tmp'
+        with open(tmp_path, 'wb') as fout:
+            np.savez(fout, ids=ids, codes=codes, dates=dates, ranks=ranks)
+        os.rename(tmp_path, sidecar_path)
+
+    return {fi.business_id: ids[codes], fi.date: dates, fi.senti_rank: ranks}
+
+'''
+Convert the buffers used while loading events into typed numpy columns.
+'''
+def make_columns(bus_col, date_col, value_col, value_key, value_dtype):
+    columns = {}
+    columns[fi.bus_idx] = buffer2array(bus_col, bus_idx_dtype)
+    columns[fi.date] = buffer2array(date_col, date_dtype)
+    columns[value_key] = buffer2array(value_col, value_dtype)
+    return columns
+
+'''
+Concatenate dictionaries of typed columns (e.g. the columns read from several
+partitions) into a single dictionary of typed columns.
+'''
+def concat_columns(parts, keys, dtypes):
+    columns = {}
+    for key,dtype in zip(keys, dtypes):
+        if (parts):
+            columns[key] = np.concatenate([part[key] for part in parts]).astype(dtype)
+        else:
+            columns[key] = np.zeros(0, dtype=dtype)
+    return columns
+
+'''
+Convert an array.array buffer into a numpy array with the specified data type
+without iterating over the elements.
+'''
+def buffer2array(buf, dtype):
+    return np.frombuffer(buf, dtype='i%d' % buf.itemsize).astype(dtype)
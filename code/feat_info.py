@@ -15,6 +15,7 @@ target = 'target' # target y value for regression
 
 # attribute names
 business_id = 'business_id'
+bus_idx = 'bus_idx' # dense integer index of a business
 review_id = 'review_id'
 tip_id = 'tip_id'
 user_id = 'user_id'
@@ -133,6 +134,7 @@ income_group_idx = demo_econ_feat_names.index(income_group)
 # Sentiment data
 senti_count = 'senti_count'
 senti_total = 'senti_total'
+senti_rank = 'senti_rank'
 avg_senti_rating = 'avg_senti_rating'
 
 senti_date_idx = 0
@@ -206,6 +208,7 @@ data_feat_names = data_feat_info.keys()
 
 # features included in business.json
 bus_feat_info = {business_id:(str,'MISSING'),
+                 bus_idx:(int,-1),
                  #name,(str,'MISSING'),
                  #full_address,(str,'MISSING'),
                  #city,(str,'MISSING'),
@@ -234,10 +237,10 @@ bus_feat_info = {business_id:(str,'MISSING'),
 bus_feat_names = bus_feat_info.keys()
 
 # features included in review.json
-rev_feat_names = [review_id,business_id,user_id,date,stars]
+rev_feat_names = [review_id,business_id,bus_idx,user_id,date,stars]
 
 # features included in tip.json
-tip_feat_names = [business_id,user_id,date,likes]
+tip_feat_names = [business_id,bus_idx,user_id,date,likes]
 
 # filter used to filter business data
 restaurant_filter = {restaurants:[True],
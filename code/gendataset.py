@@ -9,6 +9,10 @@ Arguments:
   revjson  - path to the file where filtered review data is stored
   tipjson  - path to the file where filtered tip data is stored
   outfile  - path to the file where the generated data set should be written
+  -npy     - (optional) write the data set as a binary matrix (see binutils)
+             instead of JSON objects
+  -partdir - (optional) load the partitioned review, tip and sentiment data
+             stored in the directory (see partutils)
 
 Created on Wed Dec  3 23:00:59 2014
 
@@ -16,8 +20,11 @@ Created on Wed Dec  3 23:00:59 2014
 """
 
 import jsonutils as ju
-import csvutils as cu
 import datautils as du
+import eventutils as eu
+import feat_info as fi
+import binutils
+import cacheutils
 import argparse
 
 def main():
@@ -29,39 +36,77 @@ def main():
     parser.add_argument('tipjson', help='path to the file where filtered tip data is stored')
     parser.add_argument('senticsv', help='path to the file where sentiment rank data is stored')
     parser.add_argument('outfile', help='path to the file where the generated data set should be written')
+    parser.add_argument('-seed', type=int, help='seed for the random number generator used for under-sampling, '+
+                                                'if not specified the generated data set is not reproducible (the seed is masked to '+
+                                                'the unsigned 32-bit range, e.g. -1 is the same as 4294967295)')
+    parser.add_argument('-exact', help='under-sample the still open class to exactly the target class size',
+                        action='store_true')
+    parser.add_argument('-npy', help='write the data set as a binary matrix (with the column names in '+
+                                     '<outfile>.json) instead of JSON objects', action='store_true')
+    parser.add_argument('-cachedir', help='directory used to cache generated data sets, if not specified '+
+                                          'data sets are not cached')
+    parser.add_argument('-cachesize', type=int, default=1024,
+                        help='the maximum size of the data set cache in megabytes (default is 1024)')
+    parser.add_argument('-partdir', help='directory holding the partitioned review, tip and sentiment data '+
+                                         '(see partitiondata.py), if specified only the partitions up to the '+
+                                         'prediction date are loaded instead of revjson, tipjson and senticsv')
 
     args = parser.parse_args()
 
-    run_script(args.pdate, args.busjson, args.revjson, args.tipjson, args.senticsv, args.outfile)
+    run_script(args.pdate, args.busjson, args.revjson, args.tipjson, args.senticsv, args.outfile,
+               cachedir=args.cachedir, cachesize=args.cachesize, seed=args.seed, usamp_exact=args.exact,
+               npy=args.npy, part_dir=args.partdir)
 # end main
 
-def run_script(pdate_str, busjson, revjson, tipjson, senticsv, outfile):
+def run_script(pdate_str, busjson, revjson, tipjson, senticsv, outfile, cachedir=None, cachesize=1024,
+               seed=None, usamp_exact=False, npy=False, part_dir=None):
     # convert pdate to seconds since the epoch
     pdate = du.date2int(du.str2date(pdate_str))
 
+    # the layout of the binary matrix
+    kind, ext = ('npy', '.npy') if (npy) else ('json', '.json')
+    schema = ju.FeatureSchema(fi.data_feat_info, targets=[fi.label, fi.target])
+
+    # copy the data set from the cache if it has been generated before
+    cache, key = None, None
+    if (cachedir):
+        inputs = cacheutils.input_files(busjson, revjson, tipjson, senticsv, part_dir)
+        cache = cacheutils.DatasetCache(cachedir, inputs, max_bytes=cachesize*1024*1024)
+        key = cache.key(pdate, seed=seed, feat_info=fi.data_feat_info, kind=kind,
+                        usamp_exact=usamp_exact)
+        if (key is None):
+            print('under-sampled data sets are not reproducible, not using the cache...')
+        if (cache.copy_out(key, ext, outfile)):
+            print('copied data set for prediction date %s from cache to %s' % (pdate_str, outfile))
+            if (npy):
+                binutils.save_columns(outfile, schema.columns, binutils.load_matrix(outfile))
+            return
+
     # load business objects
     print 'Loading business objects from %s...' % busjson
     all_buses, junk = ju.load_objects(busjson)
 
-    # load review objects
-    print 'loading review objects from %s...' % revjson
-    all_reviews, junk = ju.load_objects(revjson)
-
-    # load tip objects
-    print 'loading tip objects from %s...' % tipjson
-    all_tips, junk = ju.load_objects(tipjson)
-    
-    # load sentiment ranking data derived from tip and review data
-    print 'loading sentiment rankings from %s...' % senticsv
-    all_senti = cu.load_matrix(senticsv, has_hdr=False)
+    # load review, tip and sentiment ranking events into columnar arrays
+    if (part_dir):
+        events = eu.load_partitioned_events(all_buses, part_dir, end_date=pdate)
+    else:
+        events = eu.load_events(all_buses, revjson, tipjson, senticsv)
 
     # generate a data set the specified prediction date
     print('generate data set for prediction date %s...' % pdate_str)
-    buses = du.gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti)
+    buses = du.gen_dataset(pdate, all_buses, None, None, None, events=events, seed=seed,
+                           usamp_exact=usamp_exact)
     
     # write data set to file
     print('writing generated data set to %s...' % outfile)
-    ju.save_objects(buses, outfile)
+    if (npy):
+        binutils.save_matrix(outfile, schema.matrix(buses), schema.columns)
+    else:
+        ju.save_objects(buses, outfile)
+
+    # store the data set in the cache
+    if (cache is not None):
+        cache.copy_in(key, ext, outfile)
 # end run_script
 
 # run main method when this file is run from command line
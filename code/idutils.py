@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides the business ID dictionary that maps the 22 character
+business IDs used in the Yelp! academic dataset to dense integer indices
+(0, 1, 2, ...) and back.  The dictionary is built once when the filtered data
+files are created, it is persisted next to the filtered business file (see
+ids_path) and the index of each business is written to the filtered business,
+review and tip objects (see feat_info.bus_idx) so the later stages can join
+events to businesses by array indexing instead of string lookups.
+"""
+
+import os
+import io
+import numpy as np
+import feat_info as fi
+
+# extension added to the name of the filtered business file to get the name of
+# the file holding its business ID dictionary
+bus_ids_ext = '.ids'
+
+# data type used to store business indices
+bus_idx_dtype = np.int32
+
+'''
+Dictionary mapping business IDs to dense integer indices.  The index of a
+business is its position in the list of business IDs.
+
+Inputs:
+
+  bus_ids: (optional)
+    list of business IDs in index order, duplicates are ignored
+'''
+class BusinessIds(object):
+    def __init__(self, bus_ids=()):
+        self.ids = []
+        self.index = {}
+        for bid in bus_ids:
+            self.intern(bid)
+
+    '''
+    Return the index of the business ID, the ID is added to the dictionary if
+    it isn't already in the dictionary.
+    '''
+    def intern(self, bid):
+        idx = self.index.get(bid, None)
+        if (idx is None):
+            idx = self.index[bid] = len(self.ids)
+            self.ids.append(bid)
+        return idx
+
+    '''
+    Return the index of the business ID or the default if the business ID is
+    not in the dictionary.
+    '''
+    def get(self, bid, default=None):
+        return self.index.get(bid, default)
+
+    '''
+    Return the business ID for the index.
+    '''
+    def bus_id(self, idx):
+        return self.ids[idx]
+
+    '''
+    Return a numpy array with the index of each of the business IDs (-1 for IDs
+    that are not in the dictionary).
+    '''
+    def lookup(self, bus_ids):
+        return np.array([self.index.get(bid, -1) for bid in bus_ids], dtype=bus_idx_dtype)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, bid):
+        return bid in self.index
+
+    '''
+    Write the dictionary to the specified file (one business ID per line in
+    index order).
+    '''
+    def save(self, file_path):
+        with io.open(file_path, 'w', encoding='utf-8') as fout:
+            for bid in self.ids:
+                fout.write(unicode(bid) + u'\n')
+# end BusinessIds
+
+'''
+Return the path of the business ID dictionary stored next to the specified
+filtered business file (<busjson>.ids), the name is derived from the name of
+the business file so filtered files written to the same directory don't share
+a dictionary.
+'''
+def ids_path(busjson):
+    return os.path.abspath(busjson) + bus_ids_ext
+
+'''
+Load the business ID dictionary from the specified file.
+'''
+def load_bus_ids(file_path):
+    with io.open(file_path, 'r', encoding='utf-8') as fin:
+        return BusinessIds([line.rstrip(u'\n') for line in fin])
+
+'''
+Return the business ID dictionary for the specified business objects.  If every
+business object has a business index (i.e. it was read from a filtered business
+file) then the dictionary uses those indices, otherwise the businesses are
+numbered in list order.  Returns the dictionary and a flag indicating whether
+the stored business indices were used.
+'''
+def from_buses(buses):
+    if (len(buses) > 0 and all(fi.bus_idx in bus for bus in buses)):
+        ids = [None]*(max(bus[fi.bus_idx] for bus in buses) + 1)
+        for bus in buses:
+            ids[bus[fi.bus_idx]] = bus[fi.business_id]
+        if (None not in ids):
+            return BusinessIds(ids), True
+    return BusinessIds([bus[fi.business_id] for bus in buses]), False
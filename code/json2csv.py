@@ -28,13 +28,16 @@ def main():
 # end main
 
 def run_script(jsonfile, csvfile):
-    # load json objects
-    print 'Loading JSON objects from %s...' % jsonfile
-    objects, columns = ju.load_objects(jsonfile)
+    # the JSON objects are streamed twice so that the whole file never has to
+    # be held in memory, the first pass collects the column names
+    print 'Scanning JSON objects in %s...' % jsonfile
+    with open(jsonfile, 'r') as fin:
+        columns = ju.scan_columns(fin)
 
     # write json object to csv file
     print('writing JSON objects to %s...' % csvfile)
-    cu.write_objects(csvfile, objects, columns)
+    with open(jsonfile, 'r') as fin:
+        cu.write_objects(csvfile, ju.iter_objects(fin), columns)
 # end run_script
 
 def usage(argv):
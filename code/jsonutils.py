@@ -7,11 +7,41 @@ Created on Sun Nov 30 19:57:18 2014
 @author: John Maloney
 """
 
+import os
 import json
 import io
+import collections
+import multiprocessing as mp
 import numpy as np
 import scipy.stats as stats
 
+# use a faster JSON decoder for reading JSON objects if one is installed, the
+# decoders are used so that they return the same values as json.loads (floats
+# parsed to the nearest double and unicode strings)
+try:
+    import ujson
+    def json_loads(line):
+        return ujson.loads(line, precise_float=True)
+except ImportError:
+    try:
+        import simplejson
+        # simplejson returns str for ASCII strings unless the input is unicode
+        def json_loads(line):
+            if (isinstance(line, str)):
+                line = line.decode('utf-8')
+            return simplejson.loads(line)
+    except ImportError:
+        json_loads = json.loads
+
+# target size (in bytes) of the chunks that are parsed by each worker process
+# when a file is read in parallel
+chunk_bytes = 16*1024*1024
+
+# maximum number of chunks per worker process that are being processed (or
+# waiting to be consumed) at the same time when work is run in parallel (see
+# parallel_map)
+chunks_per_job = 2
+
 # ==================================================
 # Functions to load JSON objects from JSON files
 # ==================================================
@@ -32,6 +62,11 @@ Inputs:
     each key-value pair defines criteria that are ORed together while the
     key-value pair conditons are ANDed together
 
+  jobs: (optional)
+    the number of processes used to parse the file, when greater than one
+    the file is split into chunks that are parsed in parallel (see
+    iter_parallel), -1 uses one process per CPU (default is 1)
+
 Outputs:
 
   objects:
@@ -40,7 +75,15 @@ Outputs:
   attributes:
     list of keys that can be used to access JSON object attributes
 '''
-def load_objects(file_path, filt=None):
+def load_objects(file_path, filt=None, jobs=1):
+    if (jobs != 1):
+        objects = []
+        columns = set()
+        for obj in iter_parallel(file_path, filt, jobs=jobs):
+            objects.append(obj)
+            columns.update(set(obj.keys()))
+        return objects, columns
+
     with open(file_path, 'r') as fin:
         return read_objects(fin, filt)
 
@@ -85,6 +128,30 @@ def read_objects(fin, filt=None):
     objects = []
     # the list of columns to be populated
     columns = set()
+    for obj in iter_objects(fin, filt):
+        # add the new object to the list
+        objects.append(obj)
+        # update the list of columns names
+        columns.update(set(obj.keys()))
+
+    return objects, columns
+# end read_objects
+
+'''
+Generator that yields the JSON objects in the specified file object one at a
+time, the attributes of each object are flattened into a single level
+dictionary.  This is the streaming counterpart of read_objects, only one object
+is held in memory at a time.
+
+Inputs:
+
+  fin:
+    a file object from which JSON objects can be loaded
+
+  filt: (optional)
+    filter with the same semantics as the read_objects filter
+'''
+def iter_objects(fin, filt=None):
     # there is one JSON object per line, iterate over the lines and load the JSON
     for line in fin:
         # load the JSON object as a dictionary
@@ -93,29 +160,288 @@ def read_objects(fin, filt=None):
         obj = {}
         # flatten the values from the line_contents dictionary
         obj = flatten_dict(line_contents, obj)
-        
-        # set flag used to control whether this object is added
-        passed_filter = True
 
-        # apply the filter if appropriate
-        if (filt is not None):
-            # check the filter conditions
-            for k,v in filt.iteritems():
-                if ((k not in obj) or (obj[k] not in v)):
-                    # this object doesn't pass the filter
-                    passed_filter=False
-                    # return to the parent loop
-                    break
-
-        # add the object to the list if it passed the filter
-        if (passed_filter):
-            # add the new object to the list
-            objects.append(obj)
-            # update the list of columns names
-            columns.update(set(obj.keys()))
+        # yield the object if it passes the filter
+        if (filt is None or passes_filter(obj, filt)):
+            yield obj
+# end iter_objects
+
+'''
+Return the set of keys used by the JSON objects in the specified file object
+that pass the filter.  The objects are read one at a time so the file can be
+scanned in constant memory.
+'''
+def scan_columns(fin, filt=None):
+    columns = set()
+    for obj in iter_objects(fin, filt):
+        columns.update(set(obj.keys()))
+    return columns
+
+# ==================================================
+# Functions to read selected attributes of JSON objects
+# ==================================================
+'''
+Load only the specified attributes of the JSON objects in the specified file.
+See read_projected.
+'''
+def load_projected(file_path, keys, filt=None):
+    with open(file_path, 'r') as fin:
+        return read_projected(fin, keys, filt)
+
+'''
+Read only the specified attributes of the JSON objects in the specified file
+object.  This returns the same objects as read_objects except that each object
+only contains the requested attributes.
+
+Inputs:
 
+  fin:
+    a file object from which JSON objects can be loaded
+
+  keys:
+    list of the (flattened) names of the attributes to be read, e.g.
+    'business_id' or 'attributes.Attire'
+
+  filt: (optional)
+    filter with the same semantics as the read_objects filter, the filter
+    attributes don't need to be included in the list of keys
+
+Outputs:
+
+  objects:
+    list of JSON objects, the JSON objects are python dictionaries
+
+  columns:
+    list of keys that can be used to access JSON object attributes
+'''
+def read_projected(fin, keys, filt=None):
+    objects = list(iter_projected(fin, keys, filt))
+    columns = set()
+    for obj in objects:
+        columns.update(obj.keys())
     return objects, columns
-# end read_objects
+
+'''
+Generator that yields the JSON objects in the file object one at a time with
+only the specified attributes.  See read_projected.
+
+Only the top level values that contain one of the requested attributes (or one
+of the filter attributes) are flattened, the remaining values are skipped.
+The lines are decoded using the fastest available JSON decoder.
+'''
+def iter_projected(fin, keys, filt=None):
+    keys = list(keys)
+    filt_keys = filt.keys() if (filt is not None) else []
+    # the top level attributes that need to be flattened
+    top_keys = set(k.split('.', 1)[0] for k in keys + filt_keys)
+    for line in fin:
+        line_contents = json_loads(line)
+        # flatten only the top level values that are needed
+        obj = {}
+        for top_key in top_keys:
+            if (top_key in line_contents):
+                flatten_dict({top_key: line_contents[top_key]}, obj)
+
+        # apply the filter if appropriate
+        if (filt is not None and not passes_filter(obj, filt)):
+            continue
+
+        # keep only the requested attributes
+        yield dict((k, obj[k]) for k in keys if k in obj)
+# end iter_projected
+
+'''
+Read the specified attributes of the JSON objects in the file object into a
+dictionary of typed numpy arrays (one entry per object).
+
+Inputs:
+
+  fin:
+    a file object from which JSON objects can be loaded
+
+  column_info:
+    mapping from attribute names to (data type, default value) tuples, the data
+    type is any type accepted by numpy (e.g. int, float, bool or np.int32) and
+    the default value is used when an object doesn't contain the attribute
+
+  filt: (optional)
+    filter with the same semantics as the read_objects filter
+
+Outputs:
+
+  columns:
+    dictionary mapping attribute names to numpy arrays
+'''
+def read_columns(fin, column_info, filt=None):
+    keys = column_info.keys()
+    values = dict((k, []) for k in keys)
+    for obj in iter_projected(fin, keys, filt):
+        for k in keys:
+            val = obj.get(k, None)
+            values[k].append(column_info[k][1] if (val is None) else val)
+    return dict((k, np.array(values[k], dtype=column_info[k][0])) for k in keys)
+
+# ==================================================
+# Functions to read JSON objects in parallel
+# ==================================================
+'''
+Generator that yields the JSON objects in the specified file in file order
+while the file is parsed by a pool of worker processes.  The file is split into
+byte ranges aligned to line boundaries and each range is parsed and filtered
+by a worker, only the objects that pass the filter are sent back.  At most
+chunks_per_job chunks per worker are in flight at any time, so memory use is
+bounded by the chunk size rather than the size of the file.
+
+Inputs:
+
+  file_path:
+    the path the file containing JSON objects
+
+  filt: (optional)
+    filter with the same semantics as the read_objects filter, the values can
+    be sets (e.g. a set of business IDs) for fast membership checks
+
+  keys: (optional)
+    list of the attributes to read (see iter_projected), if None then all
+    attributes are read and flattened (see iter_objects)
+
+  jobs: (optional)
+    the number of worker processes, -1 uses one process per CPU (default)
+
+  start: (optional)
+    the byte offset (the start of a line) where reading starts (default is 0)
+
+  end: (optional)
+    the byte offset (the start of a line) where reading stops, if None then
+    the file is read to the end (default)
+'''
+def iter_parallel(file_path, filt=None, keys=None, jobs=-1, start=0, end=None):
+    if (jobs < 1):
+        jobs = mp.cpu_count()
+    if (end is None):
+        end = os.path.getsize(file_path)
+    ranges = chunk_ranges(file_path, max(jobs, (end - start)/chunk_bytes), start, end)
+    chunks = ((file_path, start, end, filt, keys) for start,end in ranges)
+    for objects in parallel_map(read_chunk, chunks, jobs):
+        for obj in objects:
+            yield obj
+# end iter_parallel
+
+'''
+Generator that yields func(arg) for each of the arguments in argument order
+while the calls are run by a pool of worker processes.  The arguments are
+consumed lazily and at most window calls (chunks_per_job calls per worker by
+default) are submitted but not yet yielded at any time, so a slow consumer
+holds back the producer of the arguments.  If an error is raised (by a call,
+while producing the arguments or by the consumer) or the generator is closed
+early then the pool is terminated rather than waiting for the pending calls.
+
+Inputs:
+
+  func:
+    the function to call, it must be defined at the top level of a module so
+    it can be sent to the worker processes
+
+  args:
+    iterable of the arguments, one call is made for each argument
+
+  jobs:
+    the number of worker processes, if jobs is 1 then the calls are made in
+    this process one after the other
+
+  window: (optional)
+    the maximum number of calls in flight, by default chunks_per_job*jobs
+'''
+def parallel_map(func, args, jobs, window=None):
+    if (jobs == 1):
+        for arg in args:
+            yield func(arg)
+        return
+
+    if (window is None):
+        window = chunks_per_job*jobs
+    pool = mp.Pool(jobs)
+    completed = False
+    try:
+        # the calls that have been submitted, in argument order
+        pending = collections.deque()
+        for arg in args:
+            pending.append(pool.apply_async(func, (arg,)))
+            # wait for the oldest call once the window is full
+            if (len(pending) >= window):
+                yield pending.popleft().get()
+        while (pending):
+            yield pending.popleft().get()
+        completed = True
+    finally:
+        # pool.join() waits forever for calls that are left behind by an error
+        if (completed):
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+# end parallel_map
+
+'''
+Split the specified file (or the part of the file between the start and end
+offsets) into (at most) the specified number of byte ranges.  The ranges are
+returned as a list of (start, end) offsets, each range starts at the beginning
+of a line and ends at the beginning of the next range.
+'''
+def chunk_ranges(file_path, num_chunks, start=0, end=None):
+    size = os.path.getsize(file_path) if (end is None) else end
+    step = max((size - start)/max(num_chunks, 1), 1)
+    bounds = [start]
+    with open(file_path, 'rb') as fin:
+        for pos in xrange(start + step, size, step):
+            if (pos <= bounds[-1]):
+                continue
+            # move to the start of the next line
+            fin.seek(pos-1)
+            fin.readline()
+            bound = fin.tell()
+            if (bound < size):
+                bounds.append(bound)
+    if (size > start):
+        bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+'''
+Parse the JSON objects in one byte range of a file (see iter_parallel).  This
+function is run by the worker processes and returns the list of objects in the
+range that pass the filter.
+'''
+def read_chunk(chunk):
+    file_path, start, end, filt, keys = chunk
+    with open(file_path, 'rb') as fin:
+        lines = iter_chunk_lines(fin, start, end)
+        if (keys is None):
+            return list(iter_objects(lines, filt))
+        else:
+            return list(iter_projected(lines, keys, filt))
+
+'''
+Generator that yields the lines of the file object that start in the byte
+range [start, end).
+'''
+def iter_chunk_lines(fin, start, end):
+    fin.seek(start)
+    pos = start
+    while (pos < end):
+        line = fin.readline()
+        if (not line):
+            break
+        pos += len(line)
+        yield line
+
+'''
+Return True if the object passes the filter (see read_objects).
+'''
+def passes_filter(obj, filt):
+    for k,v in filt.iteritems():
+        if ((k not in obj) or (obj[k] not in v)):
+            return False
+    return True
 
 '''
 Flatten the keys in d and add them to obj.
@@ -190,31 +516,32 @@ Inputs:
     a list of the names of the attributes to be written to file
 '''
 def write_objects(objects, fout, filt=None, attfilt=None):
-    # there is one JSON file per line, iterate over the lines and load the JSON
-    for obj in objects:
-        # set flag used to control whether this object is added
-        passed_filter = True
+    # consume the stream of written objects
+    for obj in write_objects_stream(objects, fout, filt, attfilt):
+        pass
+# end write_objects
 
-        # apply the filter if appropriate
-        if (filt is not None):
-            # check the filter conditions
-            for k,v in filt.iteritems():
-                if ((k not in obj) or (obj[k] not in v)):
-                    # this object doesn't pass the filter
-                    passed_filter=False
-                    # return to the parent loop
-                    break
+'''
+Generator that writes each JSON object that passes the filter to the specified
+file object and then yields it, so writing can be chained with further
+processing of the objects.  The objects can be any iterable (e.g. the generator
+returned by iter_objects) and are consumed one at a time.  The filt and attfilt
+arguments have the same semantics as in write_objects, the yielded objects are
+the original (unfiltered) objects.
+'''
+def write_objects_stream(objects, fout, filt=None, attfilt=None):
+    for obj in objects:
+        # skip the object if it doesn't pass the filter
+        if (filt is not None and not passes_filter(obj, filt)):
+            continue
 
         # filter the attributes and get a copy of the filtered object
-        if (passed_filter and (attfilt is not None)):
-            obj = filter_dict(obj, attfilt, copy=True)
-
-        # add the object to the list if it passed the filter
-        if (passed_filter):
-            # write the object to the file
-            fout.write(unicode(json.dumps(obj,ensure_ascii=False,sort_keys=True))+'\n')
-    # end for
-# end write_objects
+        out = filter_dict(obj, attfilt, copy=True) if (attfilt is not None) else obj
+
+        # write the object to the file
+        fout.write(unicode(json.dumps(out,ensure_ascii=False,sort_keys=True))+'\n')
+        yield obj
+# end write_objects_stream
 
 '''
 Filter the keys in the dictionary.  If copy is True then returns a copy of the
@@ -253,6 +580,11 @@ Inputs:
     whether the attribute values should be standardized to have a mean of zero
     and a standard deviation of one (default is False)
 
+  schema: (optional)
+    a feature schema built from column_info (see FeatureSchema), if None then
+    a schema is built from column_info, when a schema is supplied column_info
+    is not used
+
 Outputs:
 
   X:
@@ -261,33 +593,104 @@ Outputs:
   y:
     a sparse matrix with one column containing the class labels
 '''
-def json2xy(json, column_info, label_attr, std=False):
-    # convert JSON into a feature matrix
-    data, columns = get_matrix(json, column_info=column_info)
+def json2xy(json, column_info, label_attr, std=False, schema=None):
+    if (schema is None):
+        schema = FeatureSchema(column_info, targets=[label_attr])
+    return schema.xy(json, label_attr, std)
 
-    # get the column index of the class label
-    y_idx = columns.index(label_attr)
-    
-    # get the column indices of the non-class label attributes
-    X_idx = []
-    for i in xrange(len(columns)):
-        if (i != y_idx):
-            X_idx.append(i)
-    
-    # create the class label matrix
-    y = data[:,y_idx]
+'''
+Feature schema that fixes the layout of the matrices generated from JSON
+objects: the order of the columns, the data type and default value of each
+column and the positions of the label/target columns.  Matrices generated
+using the same schema always have the same layout so they can be saved and
+reused (e.g. cached matrices and trained models) without recomputing the
+column layout.
+
+Inputs:
 
-    # create the example attributes matrix
-    X = data[:,X_idx]
-    if (std):
-        # if a column contains all the same value then zscore will return nan
-        # - add small amount of random noise to the matrix
-        X = X + np.random.normal(0,0.0001,X.shape)
-        # calculate zscores for the augmented elements in the array
-        X = stats.zscore(X,axis=0)
+  column_info:
+    a mapping from attribute names to data types and default values (see
+    get_matrix)
 
-    # return the result
-    return X,y
+  targets: (optional)
+    list of the attributes that can be used as the class label or regression
+    target (y), the positions of the other columns (X) are computed once for
+    each of them
+
+  columns: (optional)
+    list of the attributes in column order, by default the attributes are
+    sorted by name so the order doesn't depend on dictionary ordering
+'''
+class FeatureSchema(object):
+    def __init__(self, column_info, targets=(), columns=None):
+        if (columns is None):
+            columns = sorted(column_info.keys())
+        self.column_info = dict((key, column_info[key]) for key in columns)
+        self.columns = list(columns)
+        self.dtypes = [column_info[key][0] for key in columns]
+        self.defaults = [column_info[key][1] for key in columns]
+        self.index = dict((key, j) for j,key in enumerate(columns))
+        self.plan = compile_plan(column_info, columns)
+        # positions of the target column and the remaining columns for each target
+        self.y_idx = {}
+        self.X_idx = {}
+        for target in targets:
+            if (target in self.index):
+                y_idx = self.index[target]
+                self.y_idx[target] = y_idx
+                self.X_idx[target] = [j for j in xrange(len(columns)) if j != y_idx]
+
+    '''
+    Return the position of the specified column.
+    '''
+    def position(self, key):
+        return self.index[key]
+
+    '''
+    Return the names of the columns of the examples matrix (X) generated for
+    the specified target.
+    '''
+    def feature_names(self, target):
+        return [self.columns[j] for j in self.X_idx[target]]
+
+    '''
+    Convert the JSON objects into a matrix with one column for each attribute
+    in the schema.
+    '''
+    def matrix(self, objects):
+        data, columns = get_matrix(objects, plan=self.plan)
+        return data
+
+    '''
+    Convert the JSON objects into examples (X) and labels or targets (y) for
+    the specified target attribute, see json2xy.
+    '''
+    def xy(self, objects, target, std=False):
+        data = self.matrix(objects)
+
+        # create the class label matrix
+        y = data[:,self.y_idx[target]]
+
+        # create the example attributes matrix
+        X = data[:,self.X_idx[target]]
+        if (std):
+            # if a column contains all the same value then zscore will return nan
+            # - add small amount of random noise to the matrix
+            X = X + np.random.normal(0,0.0001,X.shape)
+            # calculate zscores for the augmented elements in the array
+            X = stats.zscore(X,axis=0)
+
+        # return the result
+        return X,y
+
+    '''
+    Return a description of the schema (name, data type and default value of
+    each column in column order) that can be saved with a matrix.
+    '''
+    def describe(self):
+        return [[key, str(self.dtypes[j]), str(self.defaults[j])]
+                for j,key in enumerate(self.columns)]
+# end FeatureSchema
 
 # ==================================================
 # Functions to load feature matrices from JSON files
@@ -386,6 +789,10 @@ Inputs:
     identify the attributes that should be included in the matrix and the data
     type and default value for each attribute
 
+  plan: (optional)
+    a column plan compiled from column_info (see compile_plan), when a plan is
+    supplied column_info is not used
+
 Outputs:
 
   features:
@@ -396,25 +803,101 @@ Outputs:
     a list of the attributes names, the placement of a column name in the list
     indicates the position of the column holding the corresponding attribute
 '''
-def get_matrix(objects, column_info):
+def get_matrix(objects, column_info=None, plan=None):
+    # compile the column plan if one wasn't supplied
+    if (plan is None):
+        plan = compile_plan(column_info)
+
     # get the number of restaurants
     N = len(objects)
     
     # get the dimension
-    columns = column_info.keys()
+    columns = [key for key,convert,defval in plan]
     D = len(columns)
 
-    # add features to numpy array
+    # add features to numpy array one column at a time
     features = np.zeros((N,D),dtype=float)
-    for obj,i in zip(objects, xrange(N)):
-        for j in xrange(D):
-            key = columns[j]
-            info = column_info[key] if (key in column_info) else (None,None)
-            features[i,j] = get_value(obj, key, info[0], info[1])
+    col = np.empty(N, dtype=object)
+    for j in xrange(D):
+        key,convert,defval = plan[j]
+        col[:] = [obj.get(key, None) for obj in objects]
+        # convert the values that are present and use the default for the rest
+        present = np.flatnonzero([val is not None for val in col])
+        features[:,j] = defval
+        if (len(present) > 0):
+            features[present,j] = convert(col[present])
 
     # return features and list of columns
     return features, columns
 
+'''
+Compile a column plan for the specified column information.  The plan resolves
+the converter and default value of each column once so that get_matrix can
+convert whole columns at a time.  A plan can be compiled once and reused for
+any number of calls to get_matrix.
+
+Inputs:
+
+  column_info:
+    a mapping from attribute names to data types and default values (see
+    get_matrix)
+
+  columns: (optional)
+    list of the attributes to include in the matrix (in column order), by
+    default all the attributes in column_info are included
+
+Outputs:
+
+  plan:
+    list with one (key, converter, default value) tuple for each column, the
+    converter converts an object array of values into a float array
+
+A ValueError is raised if a column has no data type or an unsupported data type.
+'''
+def compile_plan(column_info, columns=None):
+    if (columns is None):
+        columns = column_info.keys()
+
+    plan = []
+    for key in columns:
+        dtype,defval = column_info[key] if (key in column_info) else (None,None)
+        defval = float(defval) if isinstance(defval, (bool,int,long,float)) else float('nan')
+        plan.append((key, get_converter(key, dtype), defval))
+    return plan
+
+'''
+Return a function that converts an object array of (non-None) values of the
+specified column and data type into a float array.  See get_value for the
+supported data types, a ValueError is raised for any other data type and when
+a value of an ordinal column is not one of its values.
+'''
+def get_converter(key, dtype):
+    if (dtype == bool):
+        return lambda vals: vals.astype(bool)
+    elif (dtype == float):
+        return lambda vals: vals.astype(float)
+    elif (dtype == int):
+        return lambda vals: vals.astype(np.int64)
+    elif (type(dtype) == list):
+        # the first value in the list is always None
+        # if None is selected set the value to -1
+        # so subtract 1 from the index of the value
+        codes = {}
+        for i in reversed(xrange(len(dtype))):
+            codes[dtype[i]] = i-1
+        def convert(vals):
+            # look up the code of each distinct value once
+            uniq, inverse = np.unique(vals, return_inverse=True)
+            table = np.empty(len(uniq), dtype=float)
+            for i,val in enumerate(uniq):
+                if (val not in codes):
+                    raise ValueError('unknown value %r for ordinal column %s' % (val, key))
+                table[i] = codes[val]
+            return table[inverse]
+        return convert
+    else:
+        raise ValueError('unsupported type for column %s: %s' % (key, dtype))
+
 '''
 Read the value for the specified key and convert it to the specified data type.
 
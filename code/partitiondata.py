@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Partition the filtered review, tip and sentiment data by state and by month so
+that data sets can be generated by loading only the partitions they need (see
+partutils).
+
+Arguments:
+  busjson  - path to the file where filtered business data is stored
+  revjson  - path to the file where filtered review data is stored
+  tipjson  - path to the file where filtered tip data is stored
+  senticsv - path to the file where sentiment rank data is stored
+  partdir  - path to the directory where the partitions should be written
+"""
+
+import partutils
+import argparse
+
+def main():
+    desc = 'Partition the filtered review, tip and sentiment data by state and by month'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('busjson', help='path to the file where filtered business data is stored')
+    parser.add_argument('revjson', help='path to the file where filtered review data is stored')
+    parser.add_argument('tipjson', help='path to the file where filtered tip data is stored')
+    parser.add_argument('senticsv', help='path to the file where sentiment rank data is stored')
+    parser.add_argument('partdir', help='path to the directory where the partitions should be written')
+
+    args = parser.parse_args()
+
+    run_script(args.busjson, args.revjson, args.tipjson, args.senticsv, args.partdir)
+# end main
+
+def run_script(busjson, revjson, tipjson, senticsv, part_dir):
+    manifest = partutils.write_partitions(busjson, revjson, tipjson, senticsv, part_dir)
+    for kind in sorted(partutils.part_kinds.keys()):
+        num_parts = sum(len(months) for months in manifest[kind].itervalues())
+        print '%s: %d partitions for %d states' % (kind, num_parts, len(manifest[kind]))
+# end run_script
+
+# run main method when this file is run from command line
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides functions for storing the filtered review, tip and
+sentiment data as partitions keyed by state and month.  The partitions are
+stored in a directory with the following layout:
+
+  <part_dir>/manifest.json
+  <part_dir>/reviews/<state>/<YYYY-MM>.json
+  <part_dir>/tips/<state>/<YYYY-MM>.json
+  <part_dir>/senti/<state>/<YYYY-MM>.csv
+
+Each partition holds the lines of the filtered file (unchanged) for the
+businesses in one state with a date in one month.  The manifest lists the
+partitions and the number of lines in each partition, so the loaders can read
+only the partitions that can affect the requested states and date window (see
+eventutils.load_partitioned_events).
+"""
+
+import os
+import csv
+import json
+import time
+import jsonutils as ju
+import feat_info as fi
+
+# name of the manifest file
+manifest_file = 'manifest.json'
+
+# the kinds of partitioned data and the extension of their partition files
+part_kinds = {'reviews': '.json', 'tips': '.json', 'senti': '.csv'}
+
+# maximum number of lines buffered for a partition before they are written
+buffer_lines = 10000
+
+'''
+Writes lines to partition files.  The lines for each partition are buffered
+and appended to the partition file when the buffer is full, so only a bounded
+number of lines (and no file handles) are kept per partition.
+'''
+class PartitionWriter(object):
+    def __init__(self, part_dir, kind):
+        self.part_dir = part_dir
+        self.kind = kind
+        self.ext = part_kinds[kind]
+        self.buffers = {}
+        self.counts = {}
+
+    '''
+    Add a line to the partition for the state and month.
+    '''
+    def add(self, state, month, line):
+        key = (state, month)
+        buf = self.buffers.get(key, None)
+        if (buf is None):
+            buf = self.buffers[key] = []
+            self.counts[key] = 0
+            # start with an empty partition file
+            path = self.part_path(state, month)
+            if (not os.path.isdir(os.path.dirname(path))):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'wb').close()
+        buf.append(line)
+        self.counts[key] += 1
+        if (len(buf) >= buffer_lines):
+            self.flush(key)
+
+    '''
+    Append the buffered lines of the partition to its file.
+    '''
+    def flush(self, key):
+        buf = self.buffers[key]
+        if (buf):
+            with open(self.part_path(*key), 'ab') as fout:
+                fout.writelines(buf)
+            del buf[:]
+
+    '''
+    Write all the buffered lines and return the manifest entries for the
+    partitions: {state: {month: {'path': ..., 'count': ...}}}
+    '''
+    def close(self):
+        entries = {}
+        for key in self.buffers.keys():
+            self.flush(key)
+            state, month = key
+            path = os.path.relpath(self.part_path(state, month), self.part_dir)
+            entries.setdefault(state, {})[month] = {'path': path, 'count': self.counts[key]}
+        return entries
+
+    '''
+    Return the path of the partition file for the state and month.
+    '''
+    def part_path(self, state, month):
+        return os.path.join(self.part_dir, self.kind, state, month + self.ext)
+# end PartitionWriter
+
+'''
+Write the filtered review, tip and sentiment data as partitions keyed by state
+and month.
+
+Inputs:
+
+  busjson:
+    the path to the file containing the filtered JSON business objects, it is
+    used to look up the state of each business
+
+  revjson:
+    the path to the file containing the filtered JSON review objects
+
+  tipjson:
+    the path to the file containing the filtered JSON tip objects
+
+  senticsv:
+    the path to the CSV file containing the sentiment ranks
+
+  part_dir:
+    the directory where the partitions and the manifest are written
+
+Outputs:
+
+  manifest:
+    the manifest that was written to the directory
+'''
+def write_partitions(busjson, revjson, tipjson, senticsv, part_dir):
+    # look up table for the state of each business
+    print 'loading business JSON objects from %s...' % busjson
+    buses,junk = ju.load_projected(busjson, [fi.business_id, fi.state])
+    bus_states = dict((bus[fi.business_id], bus.get(fi.state, 'MISSING')) for bus in buses)
+
+    manifest = {'business': os.path.abspath(busjson)}
+
+    # partition the reviews and tips by the date (seconds since the epoch)
+    for kind,json_path in [('reviews', revjson), ('tips', tipjson)]:
+        print 'partitioning %s from %s...' % (kind, json_path)
+        writer = PartitionWriter(part_dir, kind)
+        with open(json_path, 'r') as fin:
+            for line in fin:
+                obj = ju.json_loads(line)
+                state = bus_states.get(obj[fi.business_id], None)
+                if (state is not None):
+                    writer.add(state, int2month(obj[fi.date]), line)
+        manifest[kind] = writer.close()
+
+    # partition the sentiment ranks by the date (YYYY-MM-DD string)
+    print 'partitioning sentiment ranks from %s...' % senticsv
+    writer = PartitionWriter(part_dir, 'senti')
+    with open(senticsv, 'rbU') as fin:
+        for line in fin:
+            row = next(csv.reader([line]))
+            if (not row):
+                continue
+            state = bus_states.get(row[fi.senti_bus_idx], None)
+            if (state is not None):
+                writer.add(state, row[fi.senti_date_idx][:7], line)
+    manifest['senti'] = writer.close()
+
+    # write the manifest last so that it only lists complete partitions
+    print 'writing manifest to %s...' % os.path.join(part_dir, manifest_file)
+    with open(os.path.join(part_dir, manifest_file), 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    return manifest
+# end write_partitions
+
+'''
+Load the manifest of the partitions stored in the specified directory.
+'''
+def load_manifest(part_dir):
+    with open(os.path.join(part_dir, manifest_file), 'r') as fin:
+        return json.load(fin)
+
+'''
+Return the paths of the partitions of the specified kind that can contain data
+for the requested states and date window.
+
+Inputs:
+
+  part_dir:
+    the directory where the partitions are stored
+
+  kind:
+    the kind of data (reviews, tips or senti)
+
+  states: (optional)
+    list of the states to include, if None then all states are included
+
+  start_date: (optional)
+    the earliest date (seconds since the epoch) of interest, if None then
+    there is no lower bound
+
+  end_date: (optional)
+    the latest date (seconds since the epoch) of interest, if None then there
+    is no upper bound
+'''
+def select_partitions(part_dir, kind, states=None, start_date=None, end_date=None, manifest=None):
+    if (manifest is None):
+        manifest = load_manifest(part_dir)
+    start_month = int2month(start_date) if (start_date is not None) else None
+    end_month = int2month(end_date) if (end_date is not None) else None
+
+    paths = []
+    for state in sorted(manifest[kind].keys()):
+        if (states and state not in states):
+            continue
+        for month in sorted(manifest[kind][state].keys()):
+            # months are YYYY-MM strings so they can be compared as strings
+            if (start_month is not None and month < start_month):
+                continue
+            if (end_month is not None and month > end_month):
+                continue
+            paths.append(os.path.join(part_dir, manifest[kind][state][month]['path']))
+    return paths
+
+'''
+Return the month (YYYY-MM string in UTC) of the date expressed as seconds since
+the epoch.
+'''
+def int2month(secs):
+    t = time.gmtime(secs)
+    return '%04d-%02d' % (t.tm_year, t.tm_mon)
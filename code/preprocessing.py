@@ -1,28 +1,129 @@
+import collections
 import replacers
+import spellutils
 
-def preprocessing_common(text):
+# default number of tokens kept in each of the token caches
+cache_size = 100000
+
+class LRUCache(object):
 	'''
-	Includes common preprocessing tasks on text data -
-	lowercasing, term expansion, spelling correction, repeated chars removal
+	Bounded mapping that discards the least recently used entry when it is full
 	'''
+	def __init__(self, maxsize=cache_size):
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, default=None):
+		try:
+			value = self.entries.pop(key)
+		except KeyError:
+			self.misses += 1
+			return default
+		# re-insert the entry so that it becomes the most recently used
+		self.entries[key] = value
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		if key in self.entries:
+			del self.entries[key]
+		elif len(self.entries) >= self.maxsize:
+			self.entries.popitem(last=False)
+		self.entries[key] = value
+
+	def __len__(self):
+		return len(self.entries)
+
+class Preprocessor(object):
+	'''
+	Reusable text preprocessor -
+	the replacers (and their enchant dictionaries and compiled regexes) are
+	created once, and the results of repeated character removal and spelling
+	correction are cached per token, the repeat removal memo can be shared
+	between runs by passing the path of a memo file, and if the path of a
+	spelling index (see spellutils) is passed then the index is used in place
+	of the enchant dictionaries
+	'''
+	def __init__(self, cache_size=cache_size, repeat_memo=None, spell_index=None):
+		index = spellutils.load_index(spell_index) if spell_index else None
+		self.term_expander = replacers.ContractionReplacer()
+		self.repeated_char_remover = replacers.RepeatReplacer(repeat_memo, dictionary=index)
+		self.spelling_corrector = replacers.SpellingReplacer(index=index)
+		self.repeat_cache = LRUCache(cache_size)
+		self.spelling_cache = LRUCache(cache_size)
+
+	def remove_repeats(self, token):
+		word = self.repeat_cache.get(token)
+		if word is None:
+			word = self.repeated_char_remover.replace(token)
+			self.repeat_cache.put(token, word)
+		return word
+
+	def correct_spelling(self, token):
+		word = self.spelling_cache.get(token)
+		if word is None:
+			word = self.spelling_corrector.replace(token)
+			self.spelling_cache.put(token, word)
+		return word
+
+	def save_memo(self, repeat_memo=None):
+		'''
+		Saves the repeat removal memo (to the file it was loaded from by default)
+		'''
+		self.repeated_char_remover.save_memo(repeat_memo)
 
-	# Converting to lowercase
-	text = text.lower()
+	def process(self, text):
+		'''
+		Includes common preprocessing tasks on text data -
+		lowercasing, term expansion, spelling correction, repeated chars removal
+		'''
 
-	# Term Expansion, eg. won't -> will not, we've -> we have, etc
-	term_expander = replacers.RegexpReplacer()
-	text = term_expander.replace(text)
+		# Converting to lowercase
+		text = text.lower()
 
-	tokens = text.split()
+		# Term Expansion, eg. won't -> will not, we've -> we have, etc
+		text = self.term_expander.replace(text)
 
-	# Repeated character removal, eg. loooovvveee -> love
-	repeated_char_remover = replacers.RepeatReplacer()
-	tokens = [repeated_char_remover.replace(token) for token in tokens]
+		return self.normalize_tokens(text)
 
-	# Spelling correction within one edit distance of dictionary word
-	spelling_corrector = replacers.SpellingReplacer()
-	tokens = [spelling_corrector.replace(token) for token in tokens]
+	def process_batch(self, texts):
+		'''
+		Preprocess a sequence of texts, returns a list of the normalized texts
+		'''
+		texts = self.term_expander.replace_batch([text.lower() for text in texts])
+		return [self.normalize_tokens(text) for text in texts]
 
-	text = ' '.join(tokens)
+	def normalize_tokens(self, text):
+		# Repeated character removal, eg. loooovvveee -> love, followed by
+		# spelling correction within one edit distance of dictionary word
+		tokens = [self.correct_spelling(self.remove_repeats(token)) for token in text.split()]
 
-	return text
+		return ' '.join(tokens)
+
+# module level preprocessor, created the first time it is needed
+_preprocessor = None
+
+def get_preprocessor(spell_index=None):
+	'''
+	Returns the module level Preprocessor (created on first use, the spelling
+	index is only used when it is created)
+	'''
+	global _preprocessor
+	if _preprocessor is None:
+		_preprocessor = Preprocessor(spell_index=spell_index)
+	return _preprocessor
+
+def preprocessing_common(text):
+	'''
+	Includes common preprocessing tasks on text data -
+	lowercasing, term expansion, spelling correction, repeated chars removal
+	'''
+	return get_preprocessor().process(text)
+
+def process_batch(texts):
+	'''
+	Applies preprocessing_common to a sequence of texts
+	'''
+	return get_preprocessor().process_batch(texts)
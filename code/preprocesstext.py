@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Script used to normalize the text of the Yelp! review or tip objects (see
+preprocessing.preprocessing_common) before they are scored by the sentiment
+classifier.  The input file is split into byte ranges (chunks) that are
+normalized by a pool of worker processes, each worker keeps a single
+preprocessor (and its token caches) for all of the chunks it handles.  The
+chunks are written to the output file in input order, so the output holds the
+same objects in the same order with the text attribute replaced.
+
+The progress is recorded in <outfile>.state after each chunk is written, so an
+interrupted run can be restarted with the same arguments and it will resume
+after the last completed chunk.
+
+Arguments:
+  injson   - path to the file holding the JSON review or tip objects
+  outjson  - path to the file where the normalized JSON objects should be
+             written
+  -jobs    - (optional) number of worker processes, -1 uses one process per
+             CPU (default is 1)
+  -chunkkb - (optional) size of the chunks in kilobytes (default is 1024)
+  -textkey - (optional) the name of the attribute holding the text (default
+             is text)
+  -spellindex - (optional) path to the spelling index directory (see
+             spellutils) used in place of the enchant dictionaries
+"""
+
+import os
+import json
+import time
+import multiprocessing as mp
+import jsonutils as ju
+import preprocessing
+import argparse
+
+# extension of the file used to record the progress of a run
+state_ext = '.state'
+
+# the entries of the state that identify a run (the other entries record the
+# progress of the run)
+run_keys = ['input', 'size', 'mtime', 'chunk_kb', 'text_key', 'spell_index']
+
+def main():
+    desc = 'Normalize the text of the Yelp! review or tip objects'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('injson', help='path to the file holding the JSON review or tip objects')
+    parser.add_argument('outjson', help='path to the file where the normalized JSON objects should be written')
+    parser.add_argument('-jobs', type=int, default=1,
+                        help='the number of worker processes, if less than one then one process is used '+
+                             'for each core (default is 1)')
+    parser.add_argument('-chunkkb', type=int, default=1024,
+                        help='the size of the chunks in kilobytes (default is 1024)')
+    parser.add_argument('-textkey', default='text',
+                        help='the name of the attribute holding the text (default is text)')
+    parser.add_argument('-spellindex', help='path to the spelling index directory (see buildspellindex.py) '+
+                                            'used in place of the enchant dictionaries')
+
+    args = parser.parse_args()
+
+    run_script(args.injson, args.outjson, jobs=args.jobs, chunk_kb=args.chunkkb, text_key=args.textkey,
+               spell_index=args.spellindex)
+# end main
+
+def run_script(injson, outjson, jobs=1, chunk_kb=1024, text_key='text', spell_index=None):
+    if (jobs < 1):
+        jobs = mp.cpu_count()
+
+    # split the input file into chunks, the chunks only depend on the file and
+    # the chunk size so they are the same when a run is resumed
+    size = os.path.getsize(injson)
+    ranges = ju.chunk_ranges(injson, size/(chunk_kb*1024) + 1)
+
+    # resume after the last completed chunk if the state matches this run
+    state = new_state(injson, chunk_kb, text_key, spell_index)
+    saved = load_state(outjson)
+    if (saved is not None and os.path.exists(outjson) and
+        all(saved.get(key, None) == state[key] for key in run_keys)):
+        state = saved
+        print 'resuming after chunk %d of %d...' % (state['chunks'], len(ranges))
+    fout = open(outjson, 'r+b' if (state['chunks'] > 0) else 'wb')
+
+    try:
+        # discard anything written after the last completed chunk
+        fout.truncate(state['out_bytes'])
+        fout.seek(state['out_bytes'])
+
+        print 'normalizing text in %s using %d processes...' % (injson, jobs)
+        chunks = [(injson, start, end, text_key, spell_index) for start,end in ranges[state['chunks']:]]
+        start_time = time.time()
+        texts = 0
+        for lines in ju.parallel_map(preprocess_chunk, chunks, jobs):
+            fout.writelines(lines)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+            # record the progress
+            texts += len(lines)
+            state['chunks'] += 1
+            state['texts'] += len(lines)
+            state['out_bytes'] = fout.tell()
+            save_state(outjson, state)
+
+            elapsed = max(time.time() - start_time, 1e-6)
+            print '%d/%d chunks, %d texts, %.1f texts/sec' % (state['chunks'], len(ranges),
+                                                            state['texts'], texts/elapsed)
+    finally:
+        fout.close()
+
+    print 'wrote %d normalized texts to %s' % (state['texts'], outjson)
+# end run_script
+
+'''
+Normalize the text of the JSON objects in one byte range of a file.  This
+function is run by the worker processes, it uses the module level preprocessor
+of the worker and returns the list of output lines for the range.
+'''
+def preprocess_chunk(chunk):
+    file_path, start, end, text_key, spell_index = chunk
+    preprocessor = preprocessing.get_preprocessor(spell_index)
+    with open(file_path, 'rb') as fin:
+        objects = [json.loads(line) for line in ju.iter_chunk_lines(fin, start, end) if (line.strip())]
+    # normalize the texts of the chunk as one batch
+    texts = preprocessor.process_batch([obj.get(text_key, u'') for obj in objects])
+    lines = []
+    for obj,text in zip(objects, texts):
+        obj[text_key] = text
+        lines.append(json.dumps(obj, sort_keys=True) + '\n')
+    return lines
+
+# ==================================================
+# Functions to record the progress of a run
+# ==================================================
+'''
+Return the state of a new run (see run_keys).
+'''
+def new_state(injson, chunk_kb, text_key, spell_index):
+    return {'input': os.path.abspath(injson),
+            'size': os.path.getsize(injson),
+            'mtime': os.path.getmtime(injson),
+            'chunk_kb': chunk_kb,
+            'text_key': text_key,
+            'spell_index': os.path.abspath(spell_index) if (spell_index) else None,
+            'chunks': 0,
+            'texts': 0,
+            'out_bytes': 0}
+
+'''
+Write the state of the run for the specified output file.
+'''
+def save_state(outjson, state):
+    # write to a temporary file first so that the state is never partial
+    tmp_path = outjson + state_ext + '.tmp'
+    with open(tmp_path, 'w') as fout:
+        json.dump(state, fout)
+    os.rename(tmp_path, outjson + state_ext)
+
+'''
+Load the state of the run for the specified output file, returns None if no
+state was recorded.
+'''
+def load_state(outjson):
+    state_path = outjson + state_ext
+    if (not os.path.exists(state_path)):
+        return None
+    with open(state_path, 'r') as fin:
+        return json.load(fin)
+
+# run main method when this file is run from command line
+if __name__ == "__main__":
+    main()
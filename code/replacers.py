@@ -1,8 +1,14 @@
 import re
-import enchant
+try:
+    import enchant
+except ImportError:
+    # enchant is only needed when no spelling index (see spellutils) is used
+    enchant = None
 from nltk.corpus import wordnet
 from nltk.metrics import edit_distance
 import string
+import os
+import cPickle as pickle
 
 replacement_patterns = [
     (r'won\'t', 'will not'),
@@ -16,36 +22,148 @@ replacement_patterns = [
     (r'(\w+)\'d', '\g<1> would')
 ]
 
+punctuation_regexp = re.compile('[%s]' % re.escape(string.punctuation))
+
 class RegexpReplacer(object):
     def __init__(self, patterns=replacement_patterns):
         self.patterns = [(re.compile(regex), repl) for (regex, repl) in patterns]
     def replace(self, text):
         s = text
         for (pattern, repl) in self.patterns:
-            (s, count) = re.subn(pattern, repl, s)
-        regex = re.compile('[%s]' % re.escape(string.punctuation))
-        s = regex.sub('', s)
+            (s, count) = pattern.subn(repl, s)
+        s = punctuation_regexp.sub('', s)
         return s
 
-class RepeatReplacer(object):
+# the replacements made by RegexpReplacer with the default patterns, the
+# contractions are matched on their own and the suffixes are matched after any
+# word character
+contraction_words = [
+    ("won't", 'will not'),
+    ("can't", 'cannot'),
+    ("i'm", 'i am'),
+    ("ain't", 'is not')
+]
+
+contraction_suffixes = [
+    ("'ll", ' will'),
+    ("n't", ' not'),
+    ("'ve", ' have'),
+    ("'re", ' are'),
+    ("'d", ' would')
+]
+
+# repeated suffixes (e.g. 'll'll) are the only text for which replacing every
+# match in one pass differs from the separate passes of RegexpReplacer
+repeated_suffix_regexp = re.compile("'ll'll|n'tn't|'ve've|'re're|'d'd")
+
+class ContractionReplacer(object):
+    '''
+    Makes the same replacements as RegexpReplacer with the default patterns
+    but all of the contractions are matched by one regex (using a dispatch
+    table for the replacements) and the punctuation is removed with
+    str.translate.  Unicode texts are handled as UTF-8 encoded strings, the
+    contractions and punctuation are ASCII and \\w only matches ASCII
+    characters so the results are the same.
+    '''
     def __init__(self):
-        self.repeat_regexp = re.compile(r'(\w*)(\w)\2(\w*)')
+        self.replacements = dict(contraction_words + contraction_suffixes)
+        words = [re.escape(word) for (word, repl) in contraction_words]
+        suffixes = [re.escape(word) for (word, repl) in contraction_suffixes]
+        # the matched text is captured so that split returns it at the odd positions
+        self.regexp = re.compile('(%s|(?<=\\w)(?:%s))' % ('|'.join(words), '|'.join(suffixes)))
+        self.fallback = RegexpReplacer()
+    def replace(self, text):
+        s = text.encode('utf-8') if isinstance(text, unicode) else text
+        if "'" in s:
+            if repeated_suffix_regexp.search(s):
+                return self.fallback.replace(text)
+            parts = self.regexp.split(s)
+            parts[1::2] = map(self.replacements.__getitem__, parts[1::2])
+            s = ''.join(parts)
+        s = s.translate(None, string.punctuation)
+        return s.decode('utf-8') if isinstance(text, unicode) else s
+    def replace_batch(self, texts):
+        return [self.replace(text) for text in texts]
+
+repeat_regexp = re.compile(r'(\w*)(\w)\2(\w*)')
+
+class RepeatReplacer(object):
+    '''
+    Removes repeated characters one at a time until the word is a dictionary
+    word (or no repeated characters are left).  The canonical form of every
+    word seen is memoized, the memo can be loaded from and saved to a file so
+    it can be shared between runs.  Any dictionary with a check method (e.g. a
+    spellutils.SpellIndex) can be used in place of the enchant dictionary.
+    '''
+    def __init__(self, memo_path=None, dictionary=None):
+        self.repeat_regexp = repeat_regexp
         self.repl = r'\1\2\3'
-        self.dt = enchant.Dict("en_US")
+        self.dt = dictionary if dictionary is not None else enchant.Dict("en_US")
+        self.memo_path = memo_path
+        self.memo = load_memo(memo_path) if memo_path else {}
     def replace(self, word):
-        if self.dt.check(word):
-            return word
-        repl_word = self.repeat_regexp.sub(self.repl, word)
-        if repl_word != word:
-            return self.replace(repl_word)
-        else:
-            return repl_word
+        canonical = self.memo.get(word)
+        if canonical is not None:
+            return canonical
+        # every word in the chain collapses to the same canonical form as the
+        # original word, so they are all memoized
+        chain = self.candidates(word)
+        canonical = self.first_known(chain)
+        for candidate in chain:
+            self.memo[candidate] = canonical
+            if candidate == canonical:
+                break
+        return canonical
+    def candidates(self, word):
+        # the word followed by each collapse step up to the fixed point
+        chain = [word]
+        while True:
+            repl_word = self.repeat_regexp.sub(self.repl, chain[-1])
+            if repl_word == chain[-1]:
+                return chain
+            chain.append(repl_word)
+    def first_known(self, chain):
+        # the first dictionary word in the chain (or the fixed point), words
+        # with a memoized canonical form don't have to be checked
+        for candidate in chain:
+            canonical = self.memo.get(candidate)
+            if canonical is not None:
+                return canonical
+            if self.dt.check(candidate):
+                return candidate
+        return chain[-1]
+    def save_memo(self, memo_path=None):
+        save_memo(self.memo, memo_path or self.memo_path)
+
+def load_memo(memo_path):
+    if not os.path.exists(memo_path):
+        return {}
+    with open(memo_path, 'rb') as fin:
+        return pickle.load(fin)
+
+def save_memo(memo, memo_path):
+    # write to a temporary file first so that the memo is never partial
+    tmp_path = memo_path + '.tmp'
+    with open(tmp_path, 'wb') as fout:
+        pickle.dump(memo, fout, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, memo_path)
 
 class SpellingReplacer(object):
-    def __init__(self, dict_name='en', max_dist=1):
-        self.spell_dict = enchant.Dict(dict_name)
+    '''
+    Replaces a word that is not in the dictionary with a dictionary word within
+    one edit.  If a spelling index (see spellutils) is supplied then the best
+    correction is looked up in the index, otherwise the first enchant
+    suggestion is used when it is within one edit.
+    '''
+    def __init__(self, dict_name='en', max_dist=1, index=None):
+        self.index = index
+        if index is None:
+            self.spell_dict = enchant.Dict(dict_name)
         self.max_dist = 1
     def replace(self, word):
+        if self.index is not None:
+            correction = self.index.correct(word)
+            return correction if correction is not None else word
         if self.spell_dict.check(word):
             return word
         suggestions = self.spell_dict.suggest(word)
@@ -16,11 +16,12 @@ Created on Sun Nov 30 23:26:13 2014
 """
 
 import jsonutils as ju
-import csvutils as cu
 import datautils as du
+import eventutils as eu
 import feat_info as fi
 import numpy as np
 import wfcvutils
+import cacheutils
 import sklearn.svm as svm
 import sklearn.metrics as metrics
 import sklearn.feature_selection as fs
@@ -50,6 +51,11 @@ def main():
                                                 'date and test prediction date (the size of the steps)')
     parser.add_argument('-nus', help='this flag turns off under-sampling for the still open class',
                         action='store_true')
+    parser.add_argument('-seed', type=int, help='seed for the random number generator used for under-sampling, '+
+                                                'if not specified the generated data sets are not reproducible (the seed is masked to '+
+                                                'the unsigned 32-bit range, e.g. -1 is the same as 4294967295)')
+    parser.add_argument('-exact', help='under-sample the still open class to exactly the target class size',
+                        action='store_true')
     parser.add_argument('-states', help='list of states to include in the data set, if not specified all states are included',
                         choices=['AZ','NV','WI'], nargs='+')
     parser.add_argument('-binary', help='generate data for a binary classification problem, the specified '+
@@ -62,6 +68,20 @@ def main():
                                      'the supplied value indicates how many components to keep, if zero '+
                                      'is supplied then the number of features will not be reduced, if ' +
                                      'a negative value is supplied then PCA is not performed')
+    parser.add_argument('-engine', help='the method used to aggregate review, tip and sentiment events '+
+                                        'when generating data sets (default is incremental)',
+                        choices=['incremental','index','numpy','loop'], default='incremental')
+    parser.add_argument('-rjobs', type=int, default=-1,
+                        help='the number of walk-forward rounds to run in parallel, if less than one then ' +
+                             'one process is used for each core, the grid search within each round uses ' +
+                             'a single core when rounds are run in parallel (default is -1)')
+    parser.add_argument('-cachedir', help='directory used to cache generated data sets, if not specified '+
+                                          'data sets are not cached')
+    parser.add_argument('-cachesize', type=int, default=1024,
+                        help='the maximum size of the data set cache in megabytes (default is 1024)')
+    parser.add_argument('-partdir', help='directory holding the partitioned review, tip and sentiment data '+
+                                         '(see partitiondata.py), if specified only the partitions for the '+
+                                         'selected states are loaded instead of revjson, tipjson and senticsv')
     parser.add_argument('-la', help='if this flag is specified, then the available attributes '+
                                        'are listed and the program exits', action='store_true')
 
@@ -122,12 +142,16 @@ def main():
     # run the script
     run_script(args.busjson, args.revjson, args.tipjson, args.senticsv, args.pdate, args.delta,
                ctype=args.ctype, usamp=(not args.nus), binary=args.binary, rfe=args.rfe,
-               pca=args.pca, reg=args.reg, feat_info=feat_info, states=args.states)
+               pca=args.pca, reg=args.reg, feat_info=feat_info, states=args.states,
+               engine=args.engine, n_round_jobs=args.rjobs, cachedir=args.cachedir,
+               cachesize=args.cachesize, seed=args.seed, usamp_exact=args.exact,
+               part_dir=args.partdir)
 # end main
 
 def run_script(busjson, revjson, tipjson, senticsv, init_pdate, delta, ctype=linsvm,
                usamp=True, binary=None, rfe=False, pca=-1, reg=False, feat_info=fi.data_feat_info,
-               states=None):
+               states=None, engine='incremental', n_round_jobs=1, cachedir=None, cachesize=1024,
+               seed=None, usamp_exact=False, part_dir=None):
     print 'Initial prediction date: %s' % init_pdate
     print 'Time delta: %d months' % delta
     if (states):
@@ -140,17 +164,18 @@ def run_script(busjson, revjson, tipjson, senticsv, init_pdate, delta, ctype=lin
     print 'Loading business objects from %s...' % busjson
     all_buses, junk = ju.load_objects(busjson)
 
-    # load review objects
-    print 'loading review objects from %s...' % revjson
-    all_reviews, junk = ju.load_objects(revjson)
+    # load review, tip and sentiment ranking events into columnar arrays
+    if (part_dir):
+        events = eu.load_partitioned_events(all_buses, part_dir, states=states)
+    else:
+        events = eu.load_events(all_buses, revjson, tipjson, senticsv)
 
-    # load tip objects
-    print 'loading tip objects from %s...' % tipjson
-    all_tips, junk = ju.load_objects(tipjson)
-    
-    # load sentiment ranking data derived from tip and review data
-    print 'loading sentiment rankings from %s...' % senticsv
-    all_senti = cu.load_matrix(senticsv, has_hdr=False)
+    # create the cache for generated data sets
+    cache = None
+    if (cachedir):
+        print 'caching generated data sets in %s...' % cachedir
+        inputs = cacheutils.input_files(busjson, revjson, tipjson, senticsv, part_dir)
+        cache = cacheutils.DatasetCache(cachedir, inputs, max_bytes=cachesize*1024*1024)
 
     # reduce the number of features using recursive feature elimination
     # - See http://scikit-learn.org/stable/auto_examples/plot_rfe_with_cross_validation.html#example-plot-rfe-with-cross-validation-py
@@ -234,11 +259,15 @@ def run_script(busjson, revjson, tipjson, senticsv, init_pdate, delta, ctype=lin
     print('run walk-forward cross validation...')
     if (usamp):
         print('  under-sampling still open class...')
+        if (seed is not None):
+            print('  under-sampling seed: %d' % seed)
     else:
         print('  NOT under-sampling still open class...')
-    results = wfcvutils.wfcv(c, param_grid, all_buses, all_reviews, all_tips, all_senti,
+    results = wfcvutils.wfcv(c, param_grid, all_buses, None, None, None,
                              pdate, delta*du.month, pca=pca, usamp=usamp,
-                             binary=binary, reg=reg, feat_info=feat_info, states=states)
+                             binary=binary, reg=reg, feat_info=feat_info, states=states,
+                             events=events, engine=engine, n_round_jobs=n_round_jobs,
+                             cache=cache, seed=seed, usamp_exact=usamp_exact)
     
     # combine the results to produce overall metrics
     y_true = None
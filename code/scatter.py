@@ -43,13 +43,16 @@ def main():
 # end main
 
 def run_script(jsonfile, attr1, attr2=None, omitLabels=None):
+    # only the class label and the plotted attributes are needed
+    keys = [fi.label, attr1] + ([attr2] if (attr2 is not None) else [])
+
     # load json objects
     print 'Loading JSON objects from %s...' % jsonfile
-    objects, columns = ju.load_objects(jsonfile)
+    objects, columns = ju.load_projected(jsonfile, keys)
 
     # convert to matrix form
     print 'Convert JSON to matrix...'
-    X,columns = ju.get_matrix(objects, fi.data_feat_info)
+    X,columns = ju.get_matrix(objects, plan=ju.compile_plan(fi.data_feat_info, keys))
 
     # get class labels
     y_idx = columns.index(fi.label)
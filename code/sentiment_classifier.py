@@ -9,7 +9,7 @@ Output:
 	.csv file <filename>_score_pickle with entries as date, id, score
 '''
 
-from bs4 import BeautifulSoup
+import xml.etree.cElementTree as ET
 import preprocessing
 import numpy as np
 import json
@@ -27,16 +27,20 @@ def get_data(filename1, filename2):
 	Get data from XML file into a numpy array
 	Extract and normalize the sentiment score
 	'''
-	soup = soup = BeautifulSoup(open(filename1))
+	texts = []
+	scores = []
 
-	sentences = soup.find_all('sentence')
+	# Stream the sentences instead of building the whole document tree, each
+	# sentence is cleared once its text and score have been extracted
+	for event, sentence in ET.iterparse(filename1):
+		if sentence.tag != 'sentence':
+			continue
 
-	data = np.array([]).reshape(0,2)
-
-	for sentence in sentences:
-		positives = len(sentence.aspectcategories(polarity="positive"))
-		negatives = len(sentence.aspectcategories(polarity="negative"))
-		review = sentence.text.strip()
+		categories = sentence.find('aspectCategories')
+		polarities = [category.get('polarity') for category in categories] if categories is not None else []
+		positives = polarities.count('positive')
+		negatives = polarities.count('negative')
+		review = (sentence.findtext('text') or '').strip()
 
 		score = positives - negatives
 		if score > 2:
@@ -44,28 +48,28 @@ def get_data(filename1, filename2):
 		elif score < -2:
 			score = -2
 
-		row = np.array([review, score])
-
-		data = np.vstack((data, row))
+		texts.append(review)
+		scores.append(score)
+		sentence.clear()
 
-	X1 = data[:, 0]
-	y = np.array(data[:, 1], dtype=np.int32)
+	y = np.array(scores, dtype=np.int32)
 
-	X2 = np.array([])
-	business_ids = np.array([])
-	dates = np.array([])
+	business_ids = []
+	dates = []
 
 	test_data = open(filename2)
 	for line in test_data:
 		line = json.loads(line)
-		X2 = np.hstack((X2, np.array(line['text'])))
-		business_ids = np.hstack((business_ids, np.array(line['business_id'])))
-		dates = np.hstack((dates, np.array(line['date'])))
-	test_data.close()	
+		texts.append(line['text'])
+		business_ids.append(line['business_id'])
+		dates.append(line['date'])
+	test_data.close()
 
-	X1 = np.hstack((X1, X2))
+	# The texts are kept as python objects rather than a fixed width string
+	# array, so each review isn't padded to the length of the longest review
+	X1 = np.array(texts, dtype=object)
 
-	return X1, y, business_ids, dates
+	return X1, y, np.array(business_ids), np.array(dates)
 
 def build_sentiment_classifier(X, y, bids, dates):
 	'''
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides an offline spelling correction index that finds the best
+dictionary word within one edit (insertion, deletion or substitution) of a
+word without calling a spell checking service.  The index follows the SymSpell
+approach: every dictionary word is stored under its own spelling and under each
+of the strings obtained by deleting one of its characters.  The words within
+one edit of a query are then among the words stored under the query and under
+the one character deletes of the query, so a query takes len(word) + 1 hash
+lookups no matter how large the dictionary is.
+
+The index is held in numpy arrays (an open addressing hash table of the keys,
+the key bytes and the word lists for each key) that are saved as .npy files in
+a directory and memory-mapped when they are loaded, so the index can be shared
+by many processes and loading it doesn't depend on its size.
+"""
+
+import os
+import io
+import json
+import zlib
+import numpy as np
+
+# name of the file holding the index metadata
+meta_file = 'meta.json'
+
+# names of the arrays stored in the index directory (<name>.npy)
+index_arrays = ['slots', 'key_bytes', 'key_offsets', 'post_offsets', 'postings',
+                'word_keys', 'counts']
+
+# version of the index file layout
+index_version = 1
+
+'''
+Spelling correction index (see the module documentation).  The index should
+be created with build_index or load_index.
+
+Inputs:
+
+  arrays:
+    dictionary mapping the names in index_arrays to numpy arrays:
+      slots        - hash table of key IDs (-1 for empty slots), the size is a
+                     power of two
+      key_bytes    - the UTF-8 bytes of all the keys (uint8)
+      key_offsets  - offsets of each key in key_bytes (one more than the number
+                     of keys)
+      post_offsets - offsets of the word list of each key in postings (one more
+                     than the number of keys)
+      postings     - the word IDs of the word lists of all the keys
+      word_keys    - the key ID of the spelling of each word
+      counts       - the frequency of each word (used to rank corrections)
+'''
+class SpellIndex(object):
+    def __init__(self, arrays):
+        for name in index_arrays:
+            setattr(self, name, arrays[name])
+        self.mask = len(self.slots) - 1
+
+    '''
+    Return the number of words in the index.
+    '''
+    def __len__(self):
+        return len(self.word_keys)
+
+    '''
+    Return True if the word is in the index.
+    '''
+    def check(self, word):
+        key_id = self.find_key(encode(word))
+        if (key_id is None):
+            return False
+        return any(self.word_keys[wid] == key_id for wid in self.key_postings(key_id))
+
+    '''
+    Return the best correction within one edit of the word: the word itself if
+    it is in the index, otherwise the most frequent word within one edit (ties
+    are broken alphabetically).  Returns None if there is no such word.  The
+    correction has the same type (unicode or UTF-8 string) as the word.
+    '''
+    def correct(self, word):
+        if (self.check(word)):
+            return word
+        query = decode(word)
+        matches = [wid for wid in self.candidates(query) if (within_one(query, self.word(wid)))]
+        if (not matches):
+            return None
+        # words are numbered alphabetically so the lower word ID wins ties
+        best = self.word(max(matches, key=lambda wid: (int(self.counts[wid]), -wid)))
+        return best if isinstance(word, unicode) else encode(best)
+
+    '''
+    Return the IDs of the words stored under the word and its one character
+    deletes (a superset of the words within one edit of the word).
+    '''
+    def candidates(self, word):
+        wids = set()
+        for key in deletes(word, include_word=True):
+            key_id = self.find_key(encode(key))
+            if (key_id is not None):
+                wids.update(self.key_postings(key_id))
+        return wids
+
+    '''
+    Return the word with the specified word ID.
+    '''
+    def word(self, wid):
+        return self.key(int(self.word_keys[wid])).decode('utf-8')
+
+    '''
+    Return the UTF-8 bytes of the key with the specified key ID.
+    '''
+    def key(self, key_id):
+        return self.key_bytes[self.key_offsets[key_id]:self.key_offsets[key_id+1]].tostring()
+
+    '''
+    Return the word IDs stored under the key with the specified key ID.
+    '''
+    def key_postings(self, key_id):
+        return self.postings[self.post_offsets[key_id]:self.post_offsets[key_id+1]].tolist()
+
+    '''
+    Return the key ID of the key (UTF-8 bytes) or None if it is not a key.
+    '''
+    def find_key(self, key):
+        slot = hash_key(key) & self.mask
+        while (True):
+            key_id = int(self.slots[slot])
+            if (key_id < 0):
+                return None
+            if (self.key(key_id) == key):
+                return key_id
+            slot = (slot + 1) & self.mask
+# end SpellIndex
+
+# ==================================================
+# Functions to build, save and load indices
+# ==================================================
+'''
+Build a spelling correction index for the specified words.
+
+Inputs:
+
+  word_counts:
+    dictionary mapping the words (unicode) to their frequencies, use a count of
+    one for every word if the frequencies are not known
+
+Outputs:
+
+  index:
+    the SpellIndex for the words
+'''
+def build_index(word_counts):
+    words = sorted(word_counts.keys())
+
+    # the word IDs stored under each key
+    key_words = {}
+    for wid,word in enumerate(words):
+        for key in deletes(word, include_word=True):
+            key_words.setdefault(encode(key), []).append(wid)
+    keys = sorted(key_words.keys())
+    key_ids = dict((key,kid) for kid,key in enumerate(keys))
+
+    arrays = {}
+    arrays['key_bytes'] = np.frombuffer(''.join(keys), dtype=np.uint8).copy()
+    arrays['key_offsets'] = np.cumsum([0] + [len(key) for key in keys]).astype(np.int64)
+    postings = [key_words[key] for key in keys]
+    arrays['post_offsets'] = np.cumsum([0] + [len(wids) for wids in postings]).astype(np.int64)
+    arrays['postings'] = np.array([wid for wids in postings for wid in wids], dtype=np.int32)
+    arrays['word_keys'] = np.array([key_ids[encode(word)] for word in words], dtype=np.int32)
+    arrays['counts'] = np.array([word_counts[word] for word in words], dtype=np.int64)
+
+    # open addressing hash table with a load factor of at most one half
+    size = 1
+    while (size < 2*len(keys)):
+        size *= 2
+    slots = np.empty(size, dtype=np.int32)
+    slots.fill(-1)
+    mask = size - 1
+    for kid,key in enumerate(keys):
+        slot = hash_key(key) & mask
+        while (slots[slot] >= 0):
+            slot = (slot + 1) & mask
+        slots[slot] = kid
+    arrays['slots'] = slots
+
+    return SpellIndex(arrays)
+# end build_index
+
+'''
+Save the index to the specified directory (one .npy file per array and the
+metadata in meta.json).
+'''
+def save_index(index, index_dir):
+    if (not os.path.isdir(index_dir)):
+        os.makedirs(index_dir)
+    for name in index_arrays:
+        # write to a temporary file first so that readers never see a partial array
+        file_path = os.path.join(index_dir, name + '.npy')
+        with open(file_path + '.tmp', 'wb') as fout:
+            np.save(fout, getattr(index, name))
+        os.rename(file_path + '.tmp', file_path)
+    meta = {'version': index_version, 'words': len(index), 'keys': len(index.key_offsets) - 1}
+    with open(os.path.join(index_dir, meta_file), 'w') as fout:
+        json.dump(meta, fout)
+
+'''
+Load the index stored in the specified directory.  By default the arrays are
+memory-mapped (read-only) rather than read into memory.
+'''
+def load_index(index_dir, mmap=True):
+    with open(os.path.join(index_dir, meta_file), 'r') as fin:
+        meta = json.load(fin)
+    if (meta['version'] != index_version):
+        raise ValueError('unsupported spelling index version %s in %s' % (meta['version'], index_dir))
+    arrays = {}
+    for name in index_arrays:
+        arrays[name] = np.load(os.path.join(index_dir, name + '.npy'), mmap_mode=('r' if mmap else None))
+    return SpellIndex(arrays)
+
+'''
+Read a word list (one word per line, optionally followed by whitespace and the
+frequency of the word).  The words are lowercased and the frequencies of words
+that appear more than once are added up.  Returns a dictionary mapping the
+words to their frequencies.
+'''
+def read_word_list(file_path):
+    word_counts = {}
+    with io.open(file_path, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            fields = line.split()
+            if (not fields):
+                continue
+            word = fields[0].lower()
+            count = int(fields[1]) if (len(fields) > 1) else 1
+            word_counts[word] = word_counts.get(word, 0) + count
+    return word_counts
+
+# ==================================================
+# Helper functions
+# ==================================================
+'''
+Return the set of strings obtained by deleting one character of the word (and
+the word itself if include_word is True).
+'''
+def deletes(word, include_word=False):
+    keys = set(word[:i] + word[i+1:] for i in xrange(len(word)))
+    if (include_word):
+        keys.add(word)
+    return keys
+
+'''
+Return True if the Levenshtein distance between the two words is at most one.
+'''
+def within_one(a, b):
+    if (len(a) > len(b)):
+        a, b = b, a
+    if (len(b) - len(a) > 1):
+        return False
+    # skip the common prefix and compare what is left after the first difference
+    i = 0
+    while (i < len(a) and a[i] == b[i]):
+        i += 1
+    if (len(a) == len(b)):
+        return a[i+1:] == b[i+1:]
+    return a[i:] == b[i+1:]
+
+'''
+Return the hash of a key (UTF-8 bytes).  crc32 is used rather than hash() so
+that the hash is the same in every process and python version.
+'''
+def hash_key(key):
+    return zlib.crc32(key) & 0xffffffff
+
+'''
+Return the UTF-8 bytes for a word (unicode or a UTF-8 encoded string).
+'''
+def encode(word):
+    return word.encode('utf-8') if isinstance(word, unicode) else word
+
+'''
+Return the unicode string for a word (unicode or a UTF-8 encoded string).
+'''
+def decode(word):
+    return word if isinstance(word, unicode) else word.decode('utf-8')
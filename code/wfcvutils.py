@@ -7,7 +7,10 @@ Created on Sun Nov 30 09:51:14 2014
 @author: John Maloney
 """
 
+import sys
 import time
+import StringIO
+import multiprocessing as mp
 import feat_info as fi
 import datautils as du
 import jsonutils as ju
@@ -42,7 +45,31 @@ Inputs:
     all the tip objects available for generating train and test datasets
 
   all_senti:
-    matrix containing all sentiment ranks to consider for the dataset
+    matrix containing all sentiment ranks to consider for the dataset, or the
+    typed sentiment columns returned by eventutils.load_senti
+
+  events: (optional)
+    an eventutils.EventStore holding the review, tip and sentiment events, if
+    specified then all_reviews, all_tips and all_senti are ignored and can be
+    None (default is None)
+
+  engine: (optional)
+    the method used by datautils.gen_dataset to aggregate the events in the
+    event store, see datautils.gen_dataset, by default the running totals kept
+    by the event store are advanced by one time delta at each step rather than
+    regenerating the aggregates from scratch (default is 'incremental')
+
+  n_round_jobs: (optional)
+    the number of rounds to train and test at the same time using a pool of
+    processes, if less than one then one process is used for each core, when
+    rounds are run in parallel the grid search within each round uses a single
+    core (joblib can't run parallel loops inside the daemonic pool processes)
+    so the rounds should use all the cores (default is 1)
+
+  cache: (optional)
+    a cacheutils.DatasetCache used to load the generated data sets if they
+    have been generated before and to store them if they haven't (default is
+    None, no caching)
 
   init_pdate:
     the initial prediction date to use (in seconds since the epoch)
@@ -61,6 +88,13 @@ Inputs:
   usamp: (optional)
     if True then the "still open" class is under-sampled (default is True)
 
+  seed: (optional)
+    seed used for under-sampling, see datautils.gen_dataset (default is None)
+
+  usamp_exact: (optional)
+    if True then under-sampling keeps exactly the target number of "still
+    open" businesses, see datautils.gen_dataset (default is False)
+
   states: (optional)
     list of the states to include in the data set, if the parameter is None
     then all states are included (default is None)
@@ -90,7 +124,8 @@ Outputs:
 '''
 def wfcv(clf, param_grid, all_buses, all_reviews, all_tips, all_senti, init_pdate, time_delta,
          feat_info=fi.data_feat_info, std_data=True, usamp=True, binary=None, reg=False, pca=-1,
-         states=None):
+         states=None, events=None, engine='incremental', n_round_jobs=1, cache=None, seed=None,
+         usamp_exact=False):
     # find the earliest and latest review dates
     start_date = int(time.time())
     end_date = 0
@@ -106,29 +141,9 @@ def wfcv(clf, param_grid, all_buses, all_reviews, all_tips, all_senti, init_pdat
     print('Earliest review date: %s' % du.date2str(du.int2date(start_date)))
     print('Latest review date:   %s' % du.date2str(du.int2date(end_date)))
     
-    # initialize the "prediction date"
-    pdate = init_pdate
-
-    # create variables for the training data - it will be populated later
-    X_train_orig,y_train = None,None
-
-    # generate the first data set
-    buses_test = du.gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, usamp=usamp, states=states, binary=binary, reg=reg)
-    if (reg):
-        # extract the target value as the y values for regression
-        X_test_orig,y_test = ju.json2xy(buses_test, feat_info, fi.target, std=False)
-    else:
-        # extract the label value as the y values for classification
-        X_test_orig,y_test = ju.json2xy(buses_test, feat_info, fi.label, std=False)
-    
-    print('Number of attributes in data set: %d' % X_test_orig.shape[1])
-
     # initialize the stop_date threshold
     stop_date = end_date - 2*time_delta
 
-    # create list to hold results
-    results = []
-
     # configure scoring metric to be used during grid search and feature selection
     if (usamp):
         # if class sizes are balanced then use accuracy
@@ -137,111 +152,252 @@ def wfcv(clf, param_grid, all_buses, all_reviews, all_tips, all_senti, init_pdat
         # if class sizes are unbalanced then use f1 score
         scorer = 'f1'
 
-    # perform "walk forward cross validation"
-    while (pdate <= stop_date):
-        print('\n===================================================================')
-        print("Train estimator using train set with prediction date %s:" % du.date2str(du.int2date(pdate)))
-        # update the prediction date for the this round
-        pdate = pdate + time_delta
+    # the train and test sets for each round are generated lazily (in date
+    # order) as they are requested
+    # the layout of the matrices generated in every round
+    schema = ju.FeatureSchema(feat_info, targets=[fi.label, fi.target])
+    gen_args = (all_buses, all_reviews, all_tips, all_senti, schema, usamp, binary, reg,
+                states, events, engine, cache, seed, usamp_exact)
+    rounds = gen_rounds(init_pdate, time_delta, stop_date, gen_args)
 
-        # use current test set as training set for this round
-        X_train_orig = X_test_orig
-        y_train = y_test
+    # the settings used to train and test the estimator in each round
+    round_args = (clf, param_grid, std_data, pca, scorer, reg)
 
-        # generate a new test set for this round
-        buses_test = du.gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, usamp=usamp, states=states, binary=binary, reg=reg)
-        if (reg):
-            # extract the target value as the y values for regression
-            X_test_orig,y_test = ju.json2xy(buses_test, feat_info, fi.target, std=False)
-        else:
-            # extract the label value as the y values for classification
-            X_test_orig,y_test = ju.json2xy(buses_test, feat_info, fi.label, std=False)
-
-        # by default, use the original untransformed X data
-        # - X_train & X_test will contain the transformed data (if any transformation is done)
-        X_train = X_train_orig
-        X_test = X_test_orig
-
-        # ===========================================
-        # apply any requested data transformations
-
-        # standardize the data
-        # See http://scikit-learn.org/stable/modules/preprocessing.html
-        if (std_data):
-            print('  Standardize the data...')
-            # scaler is trained on training set
-            scaler = prep.StandardScaler().fit(X_train_orig)
-            # scaler is used to transform both train and test data
-            X_train = scaler.transform(X_train_orig)
-            X_test = scaler.transform(X_test_orig)
-
-        # reduce the dimension of the data using PCA
-        # See http://scikit-learn.org/stable/auto_examples/applications/face_recognition.html#example-applications-face-recognition-py
-        if (pca >= 0):
-            print('  Reduce dimension using PCA...')
-            if (pca == 0):
-                pca = None
-            rand_pca = decomp.RandomizedPCA(n_components=pca, whiten=True)
-            # fit PCA on the training data
-            rand_pca.fit(X_train)
-            # transform train and test sets using PCA
-            X_train = rand_pca.transform(X_train)
-            X_test  = rand_pca.transform(X_test)
-            print('    featues remaining after PCA: %d' % X_train.shape[1])
-
-        # data transformations complete
-        # ===========================================
-
-        # use grid search to train and test the classifier:
-        # - see http://scikit-learn.org/stable/auto_examples/grid_search_digits.html#example-grid-search-digits-py
-
-        if (param_grid):
-            # train the classifier using grid search
-            gs = grid_search.GridSearchCV(clf, param_grid, n_jobs=-1, scoring=scorer)
-            #gs = grid_search.GridSearchCV(clf, param_grid, scoring=scorer)
-        else:
-            # use the classifier/regressor without grid search
-            gs = clf
-
-        print '\nTraining the estimator...'
-        gs.fit(X_train, y_train)
-
-        if (param_grid):
-            print("\nBest parameters set found on train set:\n")
-            print(gs.best_estimator_)
-            print("\nGrid scores on train set:\n")
-            for params, mean_score, scores in gs.grid_scores_:
-                print("  %0.3f (+/-%0.03f) for %r"
-                      % (mean_score, scores.std() / 2, params))
-
-        # if using RFE - print out number of features selected
-        # TBD
-
-        # collect predictions from the classifier
-        print '\nTesting the estimator...'
-        y_pred = gs.predict(X_test)
-
-        print("\nResults for test set with prediction date %s:\n" % du.date2str(du.int2date(pdate)))
-        if (reg):
-            # print out explained variance score, mean absolute error, mean squared
-            # error and R-squared metrics
-            print_reg_metrics(y_test, y_pred)
-        else:
-            # print out the confusion matrix
-            cm = metrics.confusion_matrix(y_test, y_pred)
-            print_cm(cm)
-
-        #print("\nScores on evaluation set:\n")
-        #print(metrics.classification_report(y_test, y_pred, target_names=fi.class_names))
-
-        # save results
-        results.append((y_test, y_pred))
-    #end while
+    # perform "walk forward cross validation"
+    results = []
+    if (n_round_jobs < 1):
+        n_round_jobs = mp.cpu_count()
+    if (n_round_jobs == 1):
+        # run the rounds one after the other, grid search uses all the cores
+        for r in rounds:
+            y_pred = run_round(*(r + round_args))
+            y_test = r[5]
+            # save results
+            results.append((y_test, y_pred))
+    else:
+        # run the rounds in parallel - each round is handled by one process and
+        # grid search within a round runs on that process only, joblib can't
+        # nest parallel loops inside the daemonic pool processes
+        print('Running rounds using %d processes...' % n_round_jobs)
+        # the rounds are generated lazily as the window of submitted rounds
+        # drains (see jsonutils.parallel_map), results come back in date order
+        jobs = iter_round_jobs(rounds, round_args + (1,))
+        for y_test, y_pred, output in ju.parallel_map(run_round_job, jobs, n_round_jobs):
+            # print the output captured while generating and running the round
+            sys.stdout.write(output)
+            # save results
+            results.append((y_test, y_pred))
 
     # return the true values and predictions for each round
     return results
 #end wfocv
 
+'''
+Generate the data set for the specified prediction date and return the
+examples (X) and the class labels or regression targets (y).  The gen_args
+are (all_buses, all_reviews, all_tips, all_senti, schema, usamp, binary,
+reg, states, events, engine, cache, seed, usamp_exact), see wfcv.  The schema
+is the FeatureSchema that fixes the layout of the generated matrices.
+'''
+def gen_xy(pdate, gen_args):
+    (all_buses, all_reviews, all_tips, all_senti, schema, usamp, binary, reg,
+     states, events, engine, cache, seed, usamp_exact) = gen_args
+
+    # look for the data set in the cache
+    key = None
+    if (cache is not None):
+        key = cache.key(pdate, usamp=usamp, seed=seed, binary=binary, reg=reg, states=states,
+                        feat_info=schema.column_info, usamp_exact=usamp_exact)
+        xy = cache.load_xy(key)
+        if (xy is not None):
+            print('loaded data set for prediction date %s from cache' % du.date2str(du.int2date(pdate)))
+            return xy
+
+    buses = du.gen_dataset(pdate, all_buses, all_reviews, all_tips, all_senti, usamp=usamp, states=states, binary=binary, reg=reg,
+                           events=events, engine=engine, seed=seed, usamp_exact=usamp_exact)
+    if (reg):
+        # extract the target value as the y values for regression
+        X,y = schema.xy(buses, fi.target, std=False)
+    else:
+        # extract the label value as the y values for classification
+        X,y = schema.xy(buses, fi.label, std=False)
+
+    # store the data set in the cache
+    if (cache is not None):
+        cache.save_xy(key, X, y)
+
+    return X,y
+
+'''
+Generate the train and test sets for each round of "walk forward cross
+validation".  The data set for each prediction date is the test set for one
+round and the train set for the next round.  Yields (train_pdate, test_pdate,
+X_train, y_train, X_test, y_test) tuples in date order.
+'''
+def gen_rounds(init_pdate, time_delta, stop_date, gen_args):
+    # generate the first data set
+    pdate = init_pdate
+    X_test,y_test = gen_xy(pdate, gen_args)
+
+    print('Number of attributes in data set: %d' % X_test.shape[1])
+
+    while (pdate <= stop_date):
+        # use current test set as training set for this round
+        X_train,y_train = X_test,y_test
+        # generate a new test set for this round
+        X_test,y_test = gen_xy(pdate + time_delta, gen_args)
+        yield pdate, pdate + time_delta, X_train, y_train, X_test, y_test
+        # update the prediction date for the next round
+        pdate = pdate + time_delta
+
+'''
+Train the estimator using the train set and test it using the test set for
+one round of "walk forward cross validation" and return the predictions for
+the test set.
+
+Inputs:
+
+  train_pdate, test_pdate:
+    the prediction dates of the train and test sets (only used for output)
+
+  X_train, y_train, X_test, y_test:
+    the train and test sets
+
+  clf, param_grid, std_data, pca, scorer, reg:
+    see wfcv
+
+  n_jobs: (optional)
+    the number of jobs to use for grid search (default is -1, all the cores)
+'''
+def run_round(train_pdate, test_pdate, X_train_orig, y_train, X_test_orig, y_test, clf, param_grid,
+              std_data, pca, scorer, reg, n_jobs=-1):
+    print('\n===================================================================')
+    print("Train estimator using train set with prediction date %s:" % du.date2str(du.int2date(train_pdate)))
+
+    # by default, use the original untransformed X data
+    # - X_train & X_test will contain the transformed data (if any transformation is done)
+    X_train = X_train_orig
+    X_test = X_test_orig
+
+    # ===========================================
+    # apply any requested data transformations
+
+    # standardize the data
+    # See http://scikit-learn.org/stable/modules/preprocessing.html
+    if (std_data):
+        print('  Standardize the data...')
+        # scaler is trained on training set
+        scaler = prep.StandardScaler().fit(X_train_orig)
+        # scaler is used to transform both train and test data
+        X_train = scaler.transform(X_train_orig)
+        X_test = scaler.transform(X_test_orig)
+
+    # reduce the dimension of the data using PCA
+    # See http://scikit-learn.org/stable/auto_examples/applications/face_recognition.html#example-applications-face-recognition-py
+    if (pca >= 0):
+        print('  Reduce dimension using PCA...')
+        n_components = pca
+        if (pca == 0):
+            n_components = None
+        rand_pca = decomp.RandomizedPCA(n_components=n_components, whiten=True)
+        # fit PCA on the training data
+        rand_pca.fit(X_train)
+        # transform train and test sets using PCA
+        X_train = rand_pca.transform(X_train)
+        X_test  = rand_pca.transform(X_test)
+        print('    featues remaining after PCA: %d' % X_train.shape[1])
+
+    # data transformations complete
+    # ===========================================
+
+    # use grid search to train and test the classifier:
+    # - see http://scikit-learn.org/stable/auto_examples/grid_search_digits.html#example-grid-search-digits-py
+
+    if (param_grid):
+        # train the classifier using grid search
+        gs = grid_search.GridSearchCV(clf, param_grid, n_jobs=n_jobs, scoring=scorer)
+        #gs = grid_search.GridSearchCV(clf, param_grid, scoring=scorer)
+    else:
+        # use the classifier/regressor without grid search
+        gs = clf
+
+    print '\nTraining the estimator...'
+    gs.fit(X_train, y_train)
+
+    if (param_grid):
+        print("\nBest parameters set found on train set:\n")
+        print(gs.best_estimator_)
+        print("\nGrid scores on train set:\n")
+        for params, mean_score, scores in gs.grid_scores_:
+            print("  %0.3f (+/-%0.03f) for %r"
+                  % (mean_score, scores.std() / 2, params))
+
+    # if using RFE - print out number of features selected
+    # TBD
+
+    # collect predictions from the classifier
+    print '\nTesting the estimator...'
+    y_pred = gs.predict(X_test)
+
+    print("\nResults for test set with prediction date %s:\n" % du.date2str(du.int2date(test_pdate)))
+    if (reg):
+        # print out explained variance score, mean absolute error, mean squared
+        # error and R-squared metrics
+        print_reg_metrics(y_test, y_pred)
+    else:
+        # print out the confusion matrix
+        cm = metrics.confusion_matrix(y_test, y_pred)
+        print_cm(cm)
+
+    #print("\nScores on evaluation set:\n")
+    #print(metrics.classification_report(y_test, y_pred, target_names=fi.class_names))
+
+    return y_pred
+# end run_round
+
+'''
+Generator that yields the jobs for running the rounds in worker processes (see
+run_round_job).  The output printed while each round is generated is captured
+and sent with the job, so it is printed together with the output of the round
+instead of ahead of the output of earlier rounds.
+'''
+def iter_round_jobs(rounds, round_args):
+    while (True):
+        stdout = sys.stdout
+        sys.stdout = buf = StringIO.StringIO()
+        try:
+            r = next(rounds, None)
+        except:
+            # print what was generated before the error
+            sys.stdout = stdout
+            sys.stdout.write(buf.getvalue())
+            raise
+        sys.stdout = stdout
+        gen_output = buf.getvalue()
+        if (r is None):
+            sys.stdout.write(gen_output)
+            return
+        yield r, round_args, gen_output
+
+'''
+Run one round of "walk forward cross validation" in a worker process.  The
+job is a (round, round_args, gen_output) tuple where round is a tuple generated
+by gen_rounds, round_args are the trailing arguments of run_round and
+gen_output is the output printed while the round was generated.  The output
+produced by the round is captured so that it can be printed in date order.
+Returns (y_test, y_pred, output).
+'''
+def run_round_job(job):
+    r, round_args, gen_output = job
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        y_pred = run_round(*(r + round_args))
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return r[5], y_pred, gen_output + output
+
 '''
 Print out the confusion matrix.
 '''